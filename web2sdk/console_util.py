@@ -1,5 +1,11 @@
 # -*- coding: utf-8 -*-
 import sys
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
 
 ANSI_RGB = "\033[38;2;{};{};{}m"
 ANSI_RGB_BG = "\033[48;2;{};{};{}m"
@@ -65,4 +71,23 @@ def print_progress_bar(progress=0.0, label=""):
 
     progress_bar_contents += ANSI_RESET
     sys.stdout.write("{} [{}] {:.1f}%".format(label, progress_bar_contents, progress * 100))
-    sys.stdout.flush()
\ No newline at end of file
+    sys.stdout.flush()
+
+
+# peak resident set size of this process in bytes, or None if unknown. With
+# children, the largest peak of its finished worker processes instead
+def peak_memory_usage(children: bool = False) -> Optional[int]:
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    max_rss = resource.getrusage(who).ru_maxrss
+    # macOS reports bytes, Linux reports kilobytes
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def print_peak_memory_usage():
+    peak = peak_memory_usage()
+    if peak is None:
+        print("Peak memory usage: unavailable on this platform")
+    else:
+        print("Peak memory usage: {:.1f} MiB".format(peak / (1024 * 1024)))
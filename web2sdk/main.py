@@ -1,10 +1,8 @@
 import argparse
-import os
 import sys
 from typing import Any, Optional, Sequence, Union
-from web2sdk.web2swagger.main import main as web2swagger_main
-from web2sdk.swagger2sdk.main import construct_sdk
-from web2sdk import console_util
+from web2sdk.web2swagger.main import CaptureError
+from web2sdk import console_util, pipeline, profiling, spec_io
 
 def progress_callback(progress):
     console_util.print_progress_bar(progress, "Generating SDK...           ")
@@ -24,7 +22,7 @@ def main():
   parser.add_argument(
     "-r",
     "--requests-path",
-    help="Path to a mitmproxy dump file or HAR",
+    help="Path to a mitmproxy dump file or HAR, or a directory or glob pattern matching several of them",
     required=False,
   )
 
@@ -58,6 +56,100 @@ def main():
     required=False,
   )
 
+  parser.add_argument(
+    "-w",
+    "--workers",
+    help="Number of worker processes used to parse HAR files or decode mitmproxy flows in parallel. Use 0 for one per CPU core.",
+    default="1",
+    required=False,
+  )
+
+  parser.add_argument(
+    "--low-memory",
+    help="Read HAR files one entry at a time instead of keeping every parsed entry in memory",
+    action="store_true",
+    required=False,
+  )
+
+  parser.add_argument(
+    "--report-memory",
+    help="Print the peak memory usage after generating the OpenAPI schema",
+    action="store_true",
+    required=False,
+  )
+
+  parser.add_argument(
+    "--incremental",
+    help="Skip flows that were already merged into the OpenAPI schema by a previous run",
+    action="store_true",
+    required=False,
+  )
+
+  parser.add_argument(
+    "--include-url",
+    help="Only process requests whose URL matches this glob. Can be given multiple times.",
+    action="append",
+    default=[],
+    required=False,
+  )
+
+  parser.add_argument(
+    "--exclude-url",
+    help="Skip requests whose URL matches this glob. Can be given multiple times.",
+    action="append",
+    default=[],
+    required=False,
+  )
+
+  parser.add_argument(
+    "--mime-types",
+    help="Comma separated response MIME type globs to process, e.g. 'application/json,text/*'",
+    required=False,
+  )
+
+  parser.add_argument(
+    "--no-cluster-paths",
+    help="Keep every concrete API path instead of turning ids, hashes and other variable segments into path parameters",
+    action="store_true",
+    required=False,
+  )
+
+  parser.add_argument(
+    "--sample-per-endpoint",
+    help="Only infer schemas from a random sample of at most this many requests per endpoint and status",
+    default="0",
+    required=False,
+  )
+
+  parser.add_argument(
+    "--spec-format",
+    help="Format of the generated OpenAPI schema. Possible values: yaml, json.",
+    choices=spec_io.SPEC_FORMATS,
+    default="yaml",
+    required=False,
+  )
+
+  parser.add_argument(
+    "--no-spec",
+    help="Only write the SDK, not the OpenAPI schema it is generated from",
+    action="store_true",
+    required=False,
+  )
+
+  parser.add_argument(
+    "--profile",
+    help="Write the time spent in each stage, flow and body counters, and the peak memory usage to this JSON file",
+    metavar="REPORT",
+    required=False,
+  )
+
+  parser.add_argument(
+    "--profile-stage",
+    help="With --profile, also run this stage under cProfile and write the data to <report>.prof",
+    choices=profiling.STAGES,
+    required=False,
+  )
+
   args = parser.parse_args()
   output_path = args.output.rstrip("/")
 
@@ -67,16 +159,37 @@ def main():
     if args.auth_type and args.auth_type not in ["basic", "bearer", "none"]:
       parser.error("--auth-type must be one of 'basic', 'bearer', or 'none.")
     
-    openapi_path = f"{output_path}/{args.sdk_name}.yaml"
+    openapi_path = f"{output_path}/{args.sdk_name}.{args.spec_format}"
     sdk_path = f"{output_path}/{args.sdk_name}.py"
-    os.makedirs(output_path, exist_ok=True)
     
     print("\n")
-    web2swagger_main(args.sdk_name, ["--input", args.requests_path, "--output", openapi_path, "--api-prefix", args.base_url])
-    print("OpenAPI schema generated successfully at: ", openapi_path)
-    print("\n")
-    construct_sdk(openapi_path, args.sdk_name, output_path, auth_type=args.auth_type, progress_callback=progress_callback)
+    try:
+      with profiling.profiled(args.profile, args.profile_stage):
+        pipeline.run(
+          args.requests_path,
+          args.base_url,
+          args.sdk_name,
+          output_path,
+          spec_path=None if args.no_spec else openapi_path,
+          auth_type=args.auth_type,
+          progress_callback=progress_callback,
+          workers=int(args.workers),
+          low_memory=args.low_memory,
+          report_memory=args.report_memory,
+          incremental=args.incremental,
+          include_url=args.include_url,
+          exclude_url=args.exclude_url,
+          mime_types=args.mime_types,
+          no_cluster_paths=args.no_cluster_paths,
+          sample_per_endpoint=int(args.sample_per_endpoint),
+          spec_format=args.spec_format,
+        )
+    except CaptureError as e:
+      print(f"{console_util.ANSI_RED}{e}{console_util.ANSI_RESET}")
+      sys.exit(1)
     print(" Done!")
+    if not args.no_spec:
+      print("OpenAPI schema generated successfully at: ", openapi_path)
     sys.stdout.write(f"SDK generated successfully at: {sdk_path}")
   else:
     while True:
@@ -99,12 +212,14 @@ def main():
         auth_type = "none"
       
       openapi_path = f"generated/{sdk_name}.yaml"
-      os.makedirs("generated", exist_ok=True)
-      web2swagger_main(sdk_name, ["--input", requests_path, "--output", openapi_path, "--api-prefix", base_url])
-      print("OpenAPI schema generated successfully at: ", openapi_path)
-      print("\n")
-      construct_sdk(openapi_path, args.sdk_name, output_path, auth_type=args.auth_type, progress_callback=progress_callback)
+      sdk_path = f"generated/{sdk_name}.py"
+      try:
+        pipeline.run(requests_path, base_url, sdk_name, "generated", spec_path=openapi_path, auth_type=auth_type, progress_callback=progress_callback)
+      except CaptureError as e:
+        print(f"{console_util.ANSI_RED}{e}{console_util.ANSI_RESET}")
+        continue
       print(" Done!")
+      print("OpenAPI schema generated successfully at: ", openapi_path)
       sys.stdout.write(f"SDK generated successfully at: {sdk_path}")
 
 if __name__ == "__main__":
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Runs web2swagger and swagger2sdk in one process, for embedding web2sdk in other programs.
+
+The spec inferred from the captures is handed to the SDK generator as the
+object web2swagger built, so it is never serialized and parsed again on
+the way. Writing it to disk is an optional side output.
+"""
+import argparse
+import os
+from typing import Any, Callable, Dict, Optional
+
+from web2sdk.swagger2sdk.main import construct_sdk
+from web2sdk.web2swagger import main as web2swagger
+
+
+def web2swagger_args(
+    captures: str, api_prefix: str, spec_path: Optional[str] = None, **options
+) -> argparse.Namespace:
+    """The options of the web2swagger command, at their defaults except for options.
+
+    options are named like the parsed command line options, e.g. workers=4
+    or include_url=["*/v1/*"]. Raises TypeError for an unknown option.
+    """
+    args = web2swagger.parse_args(
+        ["--input", captures, "--output", spec_path or "", "--api-prefix", api_prefix]
+    )
+    for name, value in options.items():
+        if not hasattr(args, name):
+            raise TypeError(f"Unknown web2swagger option: {name}")
+        setattr(args, name, value)
+    return args
+
+
+def run(
+    captures: str,
+    api_prefix: str,
+    sdk_name: str,
+    output_dir: Optional[str] = "generated",
+    spec_path: Optional[str] = None,
+    base_url: Optional[str] = None,
+    auth_type: str = "none",
+    progress_callback: Optional[Callable[[float], None]] = None,
+    **options,
+) -> Dict[str, Any]:
+    """Infer an OpenAPI spec from captures, generate an SDK from it, and return the spec.
+
+    captures is a capture file, a directory or a glob pattern, like the
+    --input of web2swagger, and options are further web2swagger options,
+    see web2swagger_args. The SDK is written to <output_dir>/<sdk_name>.py,
+    or not generated if output_dir is None. The spec is only written if
+    spec_path is given, in which case a spec already there is extended.
+    Raises web2swagger's CaptureError if the captures can't be read.
+    """
+    args = web2swagger_args(captures, api_prefix, spec_path, **options)
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    swagger = web2swagger.generate_swagger(args, sdk_name)
+    if output_dir is not None:
+        construct_sdk(
+            swagger,
+            sdk_name,
+            output_dir,
+            base_url=base_url,
+            auth_type=auth_type,
+            progress_callback=progress_callback,
+        )
+    return swagger
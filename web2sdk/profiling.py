@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""Stage timers and counters, for finding out where a slow run spends its time.
+
+Instrumented code calls stage() and count() unconditionally. They do
+nothing until a Profiler is started, so an unprofiled run only pays for a
+global lookup. Stages nest: decode, infer and match_path run inside
+add_flow. Times and counters cover the main process, work done in
+--workers processes shows up as time spent waiting in the read stage.
+"""
+import contextlib
+import cProfile
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from web2sdk import console_util
+
+# the stages that are timed, in the order they run
+STAGES = [
+    "load_spec",
+    "read",
+    "sample",
+    "add_flow",
+    "match_path",
+    "decode",
+    "infer",
+    "finalize",
+    "dump_spec",
+    "codegen",
+    "to_source",
+]
+
+_profiler: Optional["Profiler"] = None
+_NO_STAGE = contextlib.nullcontext()
+
+
+class StageTimer:
+    """Adds the wall and CPU time spent in a with block to a stage of a Profiler."""
+
+    __slots__ = ("profiler", "name", "wall_start", "cpu_start")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.enter_stage(self.name)
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.exit_stage(
+            self.name,
+            time.perf_counter() - self.wall_start,
+            time.process_time() - self.cpu_start,
+        )
+        return False
+
+
+class Profiler:
+    """Per-stage wall and CPU times and named counters of one run.
+
+    If profile_stage is set, that stage also runs under cProfile, so its
+    hot functions can be inspected with pstats without the noise of the
+    other stages.
+    """
+
+    def __init__(self, profile_stage: Optional[str] = None):
+        # stage -> [calls, wall seconds, CPU seconds]
+        self.stages: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.profile_stage = profile_stage
+        self.cprofile = cProfile.Profile() if profile_stage else None
+        # how deep each stage is entered, so a stage entered again from inside itself is timed once
+        self.depth: Dict[str, int] = {}
+        # readers of several captures filter flows on their own threads
+        self.lock = threading.Lock()
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+
+    def stage(self, name: str) -> StageTimer:
+        return StageTimer(self, name)
+
+    def enter_stage(self, name: str):
+        depth = self.depth.get(name, 0)
+        self.depth[name] = depth + 1
+        if depth == 0 and name == self.profile_stage:
+            self.cprofile.enable()
+
+    def exit_stage(self, name: str, wall: float, cpu: float):
+        depth = self.depth[name] - 1
+        self.depth[name] = depth
+        if depth > 0:
+            return
+        if name == self.profile_stage:
+            self.cprofile.disable()
+        totals = self.stages.get(name)
+        if totals is None:
+            totals = self.stages[name] = [0, 0.0, 0.0]
+        totals[0] += 1
+        totals[1] += wall
+        totals[2] += cpu
+
+    def count(self, name: str, n: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self) -> dict:
+        order = {name: i for i, name in enumerate(STAGES)}
+        return {
+            "wall_seconds": time.perf_counter() - self.wall_start,
+            "cpu_seconds": time.process_time() - self.cpu_start,
+            "stages": {
+                name: {
+                    "calls": int(calls),
+                    "wall_seconds": wall,
+                    "cpu_seconds": cpu,
+                }
+                for name, (calls, wall, cpu) in sorted(
+                    self.stages.items(), key=lambda item: order.get(item[0], len(order))
+                )
+            },
+            "counters": dict(sorted(self.counters.items())),
+            "peak_rss_bytes": console_util.peak_memory_usage(),
+            "peak_rss_children_bytes": console_util.peak_memory_usage(children=True),
+            "profiled_stage": self.profile_stage,
+        }
+
+    def write_report(self, file_path: str):
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+            f.write("\n")
+
+    def dump_stats(self, file_path: str):
+        """Write the cProfile data of profile_stage, for pstats or snakeviz."""
+        self.cprofile.dump_stats(file_path)
+
+
+def start(profile_stage: Optional[str] = None) -> Profiler:
+    global _profiler
+    _profiler = Profiler(profile_stage)
+    return _profiler
+
+
+def stop() -> Optional[Profiler]:
+    global _profiler
+    profiler = _profiler
+    _profiler = None
+    return profiler
+
+
+def active() -> Optional[Profiler]:
+    return _profiler
+
+
+def stage(name: str):
+    """A context manager timing its block as part of stage name, if profiling."""
+    if _profiler is None:
+        return _NO_STAGE
+    return _profiler.stage(name)
+
+
+def count(name: str, n: int = 1):
+    if _profiler is not None:
+        _profiler.count(name, n)
+
+
+def timed_iter(name: str, items: Iterable, counter: str) -> Iterator:
+    """Time pulling each item out of items as stage name, and count the items under counter."""
+    if _profiler is None:
+        return iter(items)
+    return _timed_iter(_profiler, name, iter(items), counter)
+
+
+def _timed_iter(profiler: Profiler, name: str, items: Iterator, counter: str) -> Iterator:
+    while True:
+        with profiler.stage(name):
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+        profiler.count(counter)
+        yield item
+
+
+# the cProfile dump written next to the report at report_path
+def stats_path(report_path: str) -> str:
+    return os.path.splitext(report_path)[0] + ".prof"
+
+
+@contextlib.contextmanager
+def profiled(report_path: Optional[str], profile_stage: Optional[str] = None):
+    """Profile the with block if report_path is set, and write the JSON report there after it.
+
+    With profile_stage, the cProfile data of that stage is written to
+    stats_path(report_path) as well.
+    """
+    if not report_path:
+        yield None
+        return
+    profiler = start(profile_stage)
+    try:
+        yield profiler
+    finally:
+        stop()
+        profiler.write_report(report_path)
+        print(f"Profile written to {report_path}")
+        if profiler.cprofile is not None:
+            if profile_stage in profiler.stages:
+                profiler.dump_stats(stats_path(report_path))
+                print(
+                    f"cProfile data of the {profile_stage} stage written to {stats_path(report_path)}"
+                )
+            else:
+                # an empty dump can't be loaded by pstats
+                print(f"The {profile_stage} stage did not run, no cProfile data was written.")
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""Reads and writes OpenAPI specs as YAML or JSON.
+
+Specs are parsed and emitted with libyaml when PyYAML was built with it,
+and JSON specs with orjson when it is installed. ruamel.yaml's slower
+round-trip mode is only used for YAML specs that contain comments, so
+hand-edited specs keep them when web2swagger adds new endpoints.
+
+PyYAML resolves plain scalars by YAML 1.1 rules, which read yes, no, on
+and off as booleans and 12:30:00 as a base 60 integer. Specs are read by
+the YAML 1.2 core schema instead, like ruamel.yaml does, and strings that
+either version would read as something else are quoted when written.
+"""
+import json
+import re
+from typing import Any, Optional
+
+import ruamel.yaml
+import yaml
+
+from web2sdk import profiling
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeDumper, SafeLoader
+
+SPEC_FORMATS = ["yaml", "json"]
+
+# the plain scalars of the YAML 1.2 core schema: tag, pattern, and the first characters it can start with
+_CORE_SCHEMA_RESOLVERS = [
+    ("tag:yaml.org,2002:bool", r"^(?:true|True|TRUE|false|False|FALSE)$", list("tTfF")),
+    ("tag:yaml.org,2002:null", r"^(?:~|null|Null|NULL|)$", ["~", "n", "N", ""]),
+    ("tag:yaml.org,2002:int", r"^(?:[-+]?[0-9]+|0o[0-7]+|0x[0-9a-fA-F]+)$", list("-+0123456789")),
+    (
+        "tag:yaml.org,2002:float",
+        r"^(?:[-+]?(?:\.[0-9]+|[0-9]+(?:\.[0-9]*)?)(?:[eE][-+]?[0-9]+)?"
+        r"|[-+]?\.(?:inf|Inf|INF)|\.(?:nan|NaN|NAN))$",
+        list("-+.0123456789"),
+    ),
+]
+_CORE_SCHEMA_TAGS = {tag for tag, _, _ in _CORE_SCHEMA_RESOLVERS}
+
+
+class SpecLoader(SafeLoader):
+    """A safe loader resolving plain scalars by the YAML 1.2 core schema."""
+
+    # PyYAML's resolvers without the YAML 1.1 booleans, nulls and numbers
+    yaml_implicit_resolvers = {
+        first: [(tag, regexp) for tag, regexp in resolvers if tag not in _CORE_SCHEMA_TAGS]
+        for first, resolvers in SafeLoader.yaml_implicit_resolvers.items()
+    }
+
+
+class SpecDumper(SafeDumper):
+    """A safe dumper quoting strings that YAML 1.1 or 1.2 would read as something else."""
+
+
+for _tag, _pattern, _first in _CORE_SCHEMA_RESOLVERS:
+    SpecLoader.add_implicit_resolver(_tag, re.compile(_pattern), _first)
+    SpecDumper.add_implicit_resolver(_tag, re.compile(_pattern), _first)
+
+
+# YAML 1.2 integers: 017 is seventeen, octal is written 0o17
+def _construct_core_int(loader, node) -> int:
+    value = loader.construct_scalar(node)
+    if value.startswith("0o"):
+        return int(value[2:], 8)
+    if value.startswith("0x"):
+        return int(value[2:], 16)
+    return int(value)
+
+
+SpecLoader.add_constructor("tag:yaml.org,2002:int", _construct_core_int)
+
+# a "#" at the start of a line or after whitespace, which is how YAML comments start. Can also
+# match inside a quoted string, which only costs a slower load
+_COMMENT_RE = re.compile(r"(?:^|\s)#", re.MULTILINE)
+
+
+def spec_format(file_path: str) -> str:
+    return "json" if file_path.lower().endswith(".json") else "yaml"
+
+
+def loads_spec(text: str, format: str = "yaml") -> Any:
+    """Parse a spec. YAML with comments is loaded with ruamel.yaml, so dump_spec keeps them."""
+    if format == "json":
+        return orjson.loads(text) if orjson is not None else json.loads(text)
+    if _COMMENT_RE.search(text):
+        return ruamel.yaml.YAML().load(text)
+    return yaml.load(text, Loader=SpecLoader)
+
+
+def load_spec(file_path: str, format: Optional[str] = None) -> Any:
+    """Load the spec at file_path, in the format of its extension unless format is given.
+
+    Raises FileNotFoundError if there is no spec there yet.
+    """
+    with profiling.stage("load_spec"):
+        with open(file_path, "r", encoding="utf-8") as f:
+            text = f.read()
+        return loads_spec(text, format or spec_format(file_path))
+
+
+def dumps_spec(spec, format: str = "yaml") -> str:
+    if format == "json":
+        if orjson is not None:
+            return orjson.dumps(
+                spec, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+            ).decode("utf-8")
+        return json.dumps(spec, indent=2, ensure_ascii=False)
+    # specs loaded by ruamel.yaml carry their comments and formatting
+    if isinstance(spec, ruamel.yaml.comments.CommentedBase):
+        stream = ruamel.yaml.compat.StringIO()
+        ruamel.yaml.YAML().dump(spec, stream)
+        return stream.getvalue()
+    return yaml.dump(
+        spec,
+        Dumper=SpecDumper,
+        sort_keys=False,
+        allow_unicode=True,
+        default_flow_style=False,
+    )
+
+
+def dump_spec(spec, file_path: str, format: Optional[str] = None):
+    """Write spec to file_path, in the format of its extension unless format is given."""
+    with profiling.stage("dump_spec"):
+        text = dumps_spec(spec, format or spec_format(file_path))
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(text)
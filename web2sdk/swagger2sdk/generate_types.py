@@ -65,12 +65,12 @@ def parse_request_body(request_body: dict) -> List[ClassField]:
   for content_type, schema in content.items():
     if check_content_type(content_type, ['application/json', 'application/x-www-form-urlencoded']):
       schema = schema['schema']
-      schema_type = YAMLToPydanticType[schema.get('type')]
+      schema_type = YAMLToPydanticType[schema.get('type', 'unknown')]
       if schema.get('type') == 'object':
         required_properties: List[str] = schema.get('required', [])
         properties: dict = schema.get('properties', {})
         for name, prop in properties.items():
-          field_type: str = YAMLToPydanticType[prop['type']]
+          field_type: str = YAMLToPydanticType[prop.get('type', 'unknown')]
           field_required: bool = name in required_properties
           fields.append(ClassField(field_name=name, field_type=field_type, required=field_required))
       else:
@@ -85,12 +85,13 @@ def parse_response_body(response_body: dict) -> List[ClassField]:
   for content_type, schema in content.items():
     if content_type == 'application/json':
       schema = schema['schema']
-      schema_type = schema.get('type')
+      # a oneOf schema has no type
+      schema_type = schema.get('type', 'unknown')
       if schema_type == 'object':
         required_properties: List[str] = schema.get('required', [])
         properties: dict = schema.get('properties', {})
         for name, prop in properties.items():
-          field_type: str = YAMLToPydanticType[prop['type']]
+          field_type: str = YAMLToPydanticType[prop.get('type', 'unknown')]
           is_required: bool = name in required_properties
           fields.append(ClassField(field_name=name, field_type=field_type, required=is_required))
       elif schema_type == 'array':
@@ -1,7 +1,6 @@
 import pdb
 import ast
 import astor
-import yaml
 from pydantic import BaseModel, ConfigDict, Field, ValidationError
 from abc import ABC, abstractmethod
 from typing import List, Optional, Dict, Any, Tuple, Type, Union, Callable
@@ -9,12 +8,13 @@ from enum import Enum
 from web2sdk.swagger2sdk.generate_function import generate_function_for_endpoint
 from web2sdk.swagger2sdk.generate_types import generate_types, generate_class_def, ClassField
 from web2sdk.swagger2sdk.utils import AuthType, HTTPMethod
+from web2sdk import profiling, spec_io
 
 swagger_path = '/Users/jasonfan/Documents/code/web2sdk/web2sdk/specs.yml'
 
 def load_yaml(file_path):
-  with open(file_path, 'r') as file:
-    return yaml.safe_load(file)
+  # also reads JSON specs, and uses libyaml when it is available
+  return spec_io.load_spec(file_path)
 
 
 def generate_sdk_class(sdk_name: str, auth_type: AuthType) -> ast.ClassDef:
@@ -33,7 +33,8 @@ def generate_sdk_class(sdk_name: str, auth_type: AuthType) -> ast.ClassDef:
   return class_def
 
 def save_class_to_file(module: ast.Module, file_path: str) -> None:
-  code = astor.to_source(module)
+  with profiling.stage('to_source'):
+    code = astor.to_source(module)
   with open(file_path, 'w') as file:
     file.write(code)
 
@@ -51,39 +52,43 @@ def generate_imports() -> List[ast.Import]:
   ]
   return imports
 
-def construct_sdk(swagger_path: str, 
+def construct_sdk(swagger_path: Union[str, Dict[str, Any]], 
                   sdk_name: str, 
                   output_path: str, 
                   base_url: str = None, 
                   auth_type: AuthType = AuthType.NONE,
                   progress_callback: Callable[[float], None] = None) -> None:
-  swagger = load_yaml(swagger_path)
+  # the spec can also be passed in directly, e.g. straight from web2swagger
+  swagger = load_yaml(swagger_path) if isinstance(swagger_path, str) else swagger_path
   base_url = swagger.get('servers', [{}])[0].get('url') if not base_url else base_url
   if not base_url:
     raise ValueError('Base URL is required, but was not provided in the OpenAPI spec or as an argument.')
 
-  paths = swagger.get('paths', {})
-  imports = generate_imports()
-  class_def = generate_sdk_class(sdk_name, auth_type)
-  types: List[ast.ClassDef] = []
+  with profiling.stage('codegen'):
+    paths = swagger.get('paths', {})
+    imports = generate_imports()
+    class_def = generate_sdk_class(sdk_name, auth_type)
+    types: List[ast.ClassDef] = []
 
-  # Iterate through each path and method. Generate functions to call each endpoint, and types to validate request/response bodies
-  for index, (path, methods) in enumerate(paths.items()):
-    for method, details in methods.items():
-      endpoint = {
-        'path': path,
-        'method': method,
-        'name': f"{method.lower()}{path.replace('/', '_').replace('{', '').replace('}', '')}",
-        'parameters': details.get('parameters', None),
-        'request_body': details.get('requestBody', None),
-        'responses': details.get('responses', None)
-      }
-      _types = generate_types(endpoint)
-      _function = generate_function_for_endpoint(endpoint, base_url, auth_type, _types)
-      class_def.body.append(_function)
-      types.extend([t for t in _types if t is not None])
-    if progress_callback:
-      progress_callback(float(index+1) / len(paths))
+    # Iterate through each path and method. Generate functions to call each endpoint, and types to validate request/response bodies
+    for index, (path, methods) in enumerate(paths.items()):
+      for method, details in methods.items():
+        endpoint = {
+          'path': path,
+          'method': method,
+          'name': f"{method.lower()}{path.replace('/', '_').replace('{', '').replace('}', '')}",
+          'parameters': details.get('parameters', None),
+          'request_body': details.get('requestBody', None),
+          'responses': details.get('responses', None)
+        }
+        _types = generate_types(endpoint)
+        _function = generate_function_for_endpoint(endpoint, base_url, auth_type, _types)
+        class_def.body.append(_function)
+        profiling.count('sdk_functions')
+        types.extend([t for t in _types if t is not None])
+      if progress_callback:
+        progress_callback(float(index+1) / len(paths))
+    profiling.count('sdk_types', len(types))
 
   # Combine the imports, the SDK class, and generated types into a single module
   body = imports + types + [class_def]
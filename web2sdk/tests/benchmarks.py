@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of reading captures, inferring a spec and generating an SDK from synthetic captures.
+
+    python -m web2sdk.tests.benchmarks --flows 1000,100000 --output results.json
+
+Captures are generated into --capture-dir on first use and reused by
+later runs, a million flow mitmproxy dump takes a while to write. The
+results are written as JSON, and a previous results file can be passed
+as --baseline to print how much faster or slower each benchmark got.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+from web2sdk import console_util, pipeline
+from web2sdk.swagger2sdk.main import construct_sdk
+from web2sdk.tests import synthetic_captures
+from web2sdk.web2swagger import body_decoders
+from web2sdk.web2swagger.har_capture_reader import HarCaptureReader
+from web2sdk.web2swagger.main import generate_swagger
+from web2sdk.web2swagger.mitmproxy_capture_reader import MitmproxyCaptureReader
+
+BENCHMARKS = ["har_reader", "mitmproxy_reader", "inference", "codegen", "sdk_import"]
+DEFAULT_FLOWS = [1000, 100000, 1000000]
+# bumped when the layout of the results changes
+RESULTS_VERSION = 1
+SDK_NAME = "BenchmarkSDK"
+
+# times importing the generated SDK in a fresh interpreter, without the modules it imports
+_IMPORT_SCRIPT = """
+import http.client, json, sys, time, typing, urllib.parse
+import pydantic
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+def best_of(repeat: int, fn: Callable[[], Any]) -> Tuple[float, Any]:
+    """The shortest wall time of repeat calls of fn, and the result of the last call.
+
+    Progress bars and other output of fn are discarded.
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def count_flows(reader) -> int:
+    return sum(1 for _ in reader.captured_requests())
+
+
+def import_seconds(sdk_dir: str) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", _IMPORT_SCRIPT.format(module=SDK_NAME), sdk_dir],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def result(benchmark: str, flows: int, seconds: float, items: int, unit: str) -> dict:
+    return {
+        "benchmark": benchmark,
+        "flows": flows,
+        "seconds": seconds,
+        "items": items,
+        "unit": unit,
+        "items_per_second": items / seconds if seconds > 0 else None,
+    }
+
+
+def run_size(
+    flows: int, benchmarks: List[str], args: argparse.Namespace, work_dir: str
+) -> List[dict]:
+    """Run the selected benchmarks on captures of flows flows."""
+    options = {
+        "endpoints": args.endpoints,
+        "body_size": args.body_size,
+        "depth": args.depth,
+        "seed": args.seed,
+    }
+    results = []
+    har_path = None
+    if {"har_reader", "inference", "codegen", "sdk_import"} & set(benchmarks):
+        har_path = synthetic_captures.capture_path(args.capture_dir, "har", flows, **options)
+    if "har_reader" in benchmarks:
+        seconds, read = best_of(args.repeat, lambda: count_flows(HarCaptureReader(har_path)))
+        results.append(result("har_reader", flows, seconds, read, "flows"))
+    if "mitmproxy_reader" in benchmarks:
+        flow_path = synthetic_captures.capture_path(args.capture_dir, "flow", flows, **options)
+        seconds, read = best_of(
+            args.repeat, lambda: count_flows(MitmproxyCaptureReader(flow_path))
+        )
+        results.append(result("mitmproxy_reader", flows, seconds, read, "flows"))
+    swagger = None
+    if {"inference", "codegen", "sdk_import"} & set(benchmarks):
+        web2swagger_args = pipeline.web2swagger_args(har_path, synthetic_captures.API_PREFIX)
+        seconds, swagger = best_of(
+            args.repeat if "inference" in benchmarks else 1,
+            lambda: generate_swagger(web2swagger_args, SDK_NAME),
+        )
+        if "inference" in benchmarks:
+            results.append(result("inference", flows, seconds, flows, "flows"))
+    sdk_dir = os.path.join(work_dir, f"sdk-{flows}")
+    if swagger is not None:
+        os.makedirs(sdk_dir, exist_ok=True)
+        endpoints = sum(len(operations) for operations in swagger["paths"].values())
+        seconds, _ = best_of(
+            args.repeat if "codegen" in benchmarks else 1,
+            lambda: construct_sdk(swagger, SDK_NAME, sdk_dir),
+        )
+        if "codegen" in benchmarks:
+            results.append(result("codegen", flows, seconds, endpoints, "endpoints"))
+    if "sdk_import" in benchmarks:
+        seconds = min(import_seconds(sdk_dir) for _ in range(args.repeat))
+        results.append(result("sdk_import", flows, seconds, endpoints, "endpoints"))
+    return results
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "json_backend": body_decoders.JSON_BACKEND,
+        "libyaml": getattr(yaml, "__with_libyaml__", False),
+    }
+
+
+# seconds of each (benchmark, flows) in a results file
+def load_baseline(file_path: str) -> Dict[Tuple[str, int], float]:
+    with open(file_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    return {
+        (entry["benchmark"], entry["flows"]): entry["seconds"] for entry in baseline["results"]
+    }
+
+
+def print_results(results: List[dict], baseline: Optional[Dict[Tuple[str, int], float]]):
+    for entry in results:
+        line = "{:<18} {:>9} flows {:>10.3f}s {:>12.0f} {}/s".format(
+            entry["benchmark"],
+            entry["flows"],
+            entry["seconds"],
+            entry["items_per_second"] or 0,
+            entry["unit"],
+        )
+        previous = (baseline or {}).get((entry["benchmark"], entry["flows"]))
+        if previous:
+            line += "  {:.2f}x the baseline time".format(entry["seconds"] / previous)
+        print(line)
+
+
+def main(override_args=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmarks web2sdk on synthetic captures and writes the timings as JSON."
+    )
+    parser.add_argument(
+        "--flows",
+        default=",".join(str(flows) for flows in DEFAULT_FLOWS),
+        help="Comma separated capture sizes, in flows.",
+    )
+    parser.add_argument(
+        "--benchmarks",
+        default=",".join(BENCHMARKS),
+        help="Comma separated benchmarks to run, out of " + ", ".join(BENCHMARKS) + ".",
+    )
+    parser.add_argument(
+        "--endpoints",
+        type=int,
+        default=synthetic_captures.DEFAULT_ENDPOINTS,
+        help="How many distinct endpoints the flows are spread over.",
+    )
+    parser.add_argument(
+        "--body-size",
+        type=int,
+        default=synthetic_captures.DEFAULT_BODY_SIZE,
+        help="About how many fields each body has.",
+    )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=synthetic_captures.DEFAULT_DEPTH,
+        help="How deeply the fields of each body are nested.",
+    )
+    parser.add_argument("--seed", type=int, default=synthetic_captures.DEFAULT_SEED)
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="Run each benchmark this many times and keep the fastest run.",
+    )
+    parser.add_argument(
+        "--capture-dir",
+        default=os.path.join(tempfile.gettempdir(), "web2sdk-benchmarks"),
+        help="Where synthetic captures are generated and kept for later runs.",
+    )
+    parser.add_argument("-o", "--output", help="Write the results to this JSON file.")
+    parser.add_argument(
+        "--baseline", help="A results file of an earlier run to compare the timings with."
+    )
+    args = parser.parse_args(override_args)
+    benchmarks = [name.strip() for name in args.benchmarks.split(",") if name.strip()]
+    unknown = [name for name in benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(unknown)}")
+    sizes = [int(flows) for flows in args.flows.split(",")]
+    baseline = load_baseline(args.baseline) if args.baseline else None
+
+    results: List[dict] = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for flows in sizes:
+            size_results = run_size(flows, benchmarks, args, work_dir)
+            print_results(size_results, baseline)
+            results.extend(size_results)
+
+    report = {
+        "version": RESULTS_VERSION,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "environment": environment(),
+        "parameters": {
+            "endpoints": args.endpoints,
+            "body_size": args.body_size,
+            "depth": args.depth,
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": results,
+        "peak_rss_bytes": console_util.peak_memory_usage(),
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""Deterministic synthetic captures, as HAR files and mitmproxy dumps, for benchmarks.
+
+The same parameters always give the same flows: every endpoint has a
+fixed body shape, derived from the seed and its index, and the values in
+each flow come from a generator seeded the same way. Captures are written
+one flow at a time, so a million flows don't have to fit in memory.
+"""
+import json
+import os
+import random
+import uuid
+from typing import Iterator, NamedTuple, Optional
+
+API_PREFIX = "https://api.example.com/v1"
+DEFAULT_ENDPOINTS = 50
+DEFAULT_BODY_SIZE = 16
+DEFAULT_DEPTH = 3
+DEFAULT_SEED = 0
+
+_WORDS = [
+    "id",
+    "name",
+    "status",
+    "created",
+    "owner",
+    "title",
+    "count",
+    "price",
+    "email",
+    "active",
+    "tags",
+    "score",
+    "region",
+    "kind",
+    "updated",
+    "note",
+]
+# the value types body fields are drawn from
+_KINDS = ["int", "float", "str", "bool", "uuid", "date-time", "email", "null"]
+# the timestamp of the first flow, later flows are a second apart
+_EPOCH = 1700000000.0
+
+
+class SyntheticFlow(NamedTuple):
+    method: str
+    url: str
+    request_body: Optional[bytes]
+    status: int
+    response_body: bytes
+
+
+# the static part of an endpoint's path, its index in base 16 with one word per digit. No
+# position takes more than 16 values, so path clustering never merges endpoints
+def endpoint_base(endpoint: int) -> str:
+    segments = []
+    level = 0
+    while True:
+        segments.append(f"{_WORDS[level % len(_WORDS)]}{endpoint % 16}")
+        endpoint //= 16
+        level += 1
+        if endpoint == 0:
+            return "/" + "/".join(reversed(segments))
+
+
+def endpoint_path(endpoint: int, rng: random.Random) -> str:
+    """A concrete path of the endpoint, with fresh ids for its path parameters."""
+    base = endpoint_base(endpoint)
+    kind = endpoint % 4
+    if kind == 0:
+        return base
+    if kind == 1:
+        return f"{base}/{rng.randrange(1, 10**6)}"
+    if kind == 2:
+        return f"{base}/{uuid.UUID(int=rng.getrandbits(128))}/items"
+    return f"{base}/{rng.randrange(1, 10**4)}/sub/{rng.randrange(1, 10**4)}"
+
+
+def endpoint_shape(endpoint: int, body_size: int, depth: int, seed: int = DEFAULT_SEED) -> dict:
+    """The shape of the response bodies of an endpoint: field name -> kind, or a nested shape.
+
+    body_size fields are spread over depth levels of nesting, each level
+    nesting the next one under "child", or under "items" as an array.
+    """
+    rng = random.Random(f"{seed}:shape:{endpoint}")
+    levels = max(depth, 1)
+    per_level = max(1, body_size // levels)
+    shape: Optional[dict] = None
+    for _ in range(levels):
+        fields: dict = {}
+        for i in range(per_level):
+            fields[f"{rng.choice(_WORDS)}_{i}"] = rng.choice(_KINDS)
+        if shape is not None:
+            if rng.random() < 0.5:
+                fields["child"] = shape
+            else:
+                fields["items"] = [shape]
+        shape = fields
+    return shape
+
+
+def _scalar(kind: str, rng: random.Random):
+    if kind == "int":
+        return rng.randrange(10**6)
+    if kind == "float":
+        return round(rng.random() * 1000, 2)
+    if kind == "str":
+        return " ".join(rng.choice(_WORDS) for _ in range(rng.randrange(1, 4)))
+    if kind == "bool":
+        return rng.random() < 0.5
+    if kind == "uuid":
+        return str(uuid.UUID(int=rng.getrandbits(128)))
+    if kind == "date-time":
+        return "2024-{:02d}-{:02d}T{:02d}:{:02d}:00Z".format(
+            rng.randrange(1, 13), rng.randrange(1, 29), rng.randrange(24), rng.randrange(60)
+        )
+    if kind == "email":
+        return f"{rng.choice(_WORDS)}{rng.randrange(1000)}@example.com"
+    return None
+
+
+def fill_shape(shape: dict, rng: random.Random):
+    """A body of the given shape. Arrays get one to three elements."""
+    root: dict = {}
+    stack = [(shape, root)]
+    while stack:
+        shape, body = stack.pop()
+        for key, kind in shape.items():
+            if isinstance(kind, dict):
+                body[key] = {}
+                stack.append((kind, body[key]))
+            elif isinstance(kind, list):
+                body[key] = [{} for _ in range(rng.randrange(1, 4))]
+                for element in body[key]:
+                    stack.append((kind[0], element))
+            else:
+                body[key] = _scalar(kind, rng)
+    return root
+
+
+def iter_flows(
+    entries: int,
+    endpoints: int = DEFAULT_ENDPOINTS,
+    body_size: int = DEFAULT_BODY_SIZE,
+    depth: int = DEFAULT_DEPTH,
+    seed: int = DEFAULT_SEED,
+) -> Iterator[SyntheticFlow]:
+    """entries flows spread over endpoints endpoints, with bodies of about body_size fields.
+
+    Every fifth endpoint takes POST requests with a JSON body, and one
+    flow in fifty is a 404 without a body.
+    """
+    shapes = [endpoint_shape(endpoint, body_size, depth, seed) for endpoint in range(endpoints)]
+    rng = random.Random(f"{seed}:flows")
+    for i in range(entries):
+        endpoint = rng.randrange(endpoints)
+        url = API_PREFIX + endpoint_path(endpoint, rng) + f"?page={rng.randrange(100)}"
+        method = "POST" if endpoint % 5 == 4 else "GET"
+        request_body = None
+        if method == "POST":
+            request_body = json.dumps(fill_shape(shapes[(endpoint + 1) % endpoints], rng)).encode()
+        if i % 50 == 49:
+            yield SyntheticFlow(method, url, request_body, 404, b"")
+            continue
+        response_body = json.dumps(fill_shape(shapes[endpoint], rng)).encode()
+        yield SyntheticFlow(method, url, request_body, 200, response_body)
+
+
+def har_entry(flow: SyntheticFlow, index: int) -> dict:
+    request = {
+        "method": flow.method,
+        "url": flow.url,
+        "httpVersion": "HTTP/1.1",
+        "headers": [
+            {"name": "Accept", "value": "application/json"},
+            {"name": "User-Agent", "value": "web2sdk-benchmark"},
+        ],
+        "queryString": [],
+    }
+    if flow.request_body is not None:
+        request["postData"] = {
+            "mimeType": "application/json",
+            "text": flow.request_body.decode(),
+        }
+    return {
+        "startedDateTime": "2024-01-01T00:00:00.000Z",
+        "time": index % 100,
+        "_resourceType": "fetch",
+        "request": request,
+        "response": {
+            "status": flow.status,
+            "statusText": "OK" if flow.status == 200 else "Not Found",
+            "httpVersion": "HTTP/1.1",
+            "headers": [{"name": "Content-Type", "value": "application/json"}],
+            "content": {
+                "size": len(flow.response_body),
+                "mimeType": "application/json",
+                "text": flow.response_body.decode(),
+            },
+        },
+    }
+
+
+def write_har(file_path: str, entries: int, **options):
+    """Write a HAR file of iter_flows(entries, **options), one entry at a time."""
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write('{"log": {"version": "1.2", "creator": {"name": "web2sdk", "version": "1"}, ')
+        f.write('"pages": [], "entries": [\n')
+        for i, flow in enumerate(iter_flows(entries, **options)):
+            if i > 0:
+                f.write(",\n")
+            f.write(json.dumps(har_entry(flow, i)))
+        f.write("\n]}}\n")
+
+
+def write_flow_dump(file_path: str, entries: int, **options):
+    """Write a mitmproxy dump of iter_flows(entries, **options), one flow at a time."""
+    # only needed for mitmproxy dumps, and mitmproxy is slow to import
+    from mitmproxy import http
+    from mitmproxy import io as iom
+    from mitmproxy.test import tflow
+
+    rng = random.Random("ids")
+    client_conn = tflow.tclient_conn()
+    server_conn = tflow.tserver_conn()
+    client_conn.id = str(uuid.UUID(int=rng.getrandbits(128)))
+    server_conn.id = str(uuid.UUID(int=rng.getrandbits(128)))
+    with open(file_path, "wb") as f:
+        writer = iom.FlowWriter(f)
+        for i, flow in enumerate(iter_flows(entries, **options)):
+            request = http.Request.make(
+                flow.method,
+                flow.url,
+                flow.request_body or b"",
+                {"Accept": "application/json", "Content-Type": "application/json"},
+            )
+            request.timestamp_start = request.timestamp_end = _EPOCH + i
+            response = http.Response.make(
+                flow.status, flow.response_body, {"Content-Type": "application/json"}
+            )
+            response.timestamp_start = response.timestamp_end = _EPOCH + i
+            f_ = tflow.tflow(
+                client_conn=client_conn,
+                server_conn=server_conn,
+                req=request,
+                resp=response,
+                live=False,
+            )
+            f_.id = str(uuid.UUID(int=rng.getrandbits(128)))
+            f_.timestamp_created = _EPOCH + i
+            writer.add(f_)
+
+
+def capture_path(
+    directory: str,
+    format: str,
+    entries: int,
+    endpoints: int = DEFAULT_ENDPOINTS,
+    body_size: int = DEFAULT_BODY_SIZE,
+    depth: int = DEFAULT_DEPTH,
+    seed: int = DEFAULT_SEED,
+) -> str:
+    """The path of a synthetic capture in directory, generated unless it already exists.
+
+    The parameters are part of the file name, so captures are reused
+    between benchmark runs. format is "har" or "flow".
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = f"synthetic-{entries}-e{endpoints}-b{body_size}-d{depth}-s{seed}.{format}"
+    file_path = os.path.join(directory, name)
+    if not os.path.exists(file_path):
+        # written under a temporary name, so an interrupted run doesn't leave a truncated capture
+        tmp_path = file_path + ".tmp"
+        write = write_har if format == "har" else write_flow_dump
+        write(
+            tmp_path,
+            entries,
+            endpoints=endpoints,
+            body_size=body_size,
+            depth=depth,
+            seed=seed,
+        )
+        os.replace(tmp_path, file_path)
+    return file_path
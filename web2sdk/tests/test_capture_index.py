@@ -0,0 +1,69 @@
+import itertools
+import json
+
+import pytest
+
+from web2sdk import pipeline
+from web2sdk.web2swagger.capture_index import CaptureIndex
+from web2sdk.web2swagger.main import generate_swagger, index_main, parse_args
+
+API_PREFIX = "https://api.example.com"
+
+
+def write_har(file_path, paths):
+    entries = [
+        {
+            "request": {"method": "GET", "url": API_PREFIX + path, "headers": []},
+            "response": {
+                "status": 200,
+                "statusText": "OK",
+                "headers": [{"name": "Content-Type", "value": "application/json"}],
+                "content": {"mimeType": "application/json", "text": json.dumps({"path": path})},
+            },
+        }
+        for path in paths
+    ]
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump({"log": {"entries": entries}}, f)
+
+
+def test_flows_get_the_template_learned_from_the_whole_capture(tmp_path):
+    # slugs don't look like ids, the segment only becomes a parameter after 20 distinct values
+    slugs = ["".join(letters) for letters in itertools.product("abcde", repeat=2)]
+    capture = tmp_path / "capture.har"
+    index_path = tmp_path / "capture.idx"
+    write_har(capture, [f"/users/{slug}" for slug in slugs] + ["/status"])
+    index_main(["-i", str(capture), "-x", str(index_path), "-p", API_PREFIX])
+    index = CaptureIndex(str(index_path))
+    try:
+        assert index.endpoints() == [
+            ("get", "/status", 200, 1),
+            ("get", "/users/{user_id}", 200, len(slugs)),
+        ]
+    finally:
+        index.close()
+
+
+def test_indexed_reads_apply_the_url_filters(tmp_path):
+    capture = tmp_path / "capture.har"
+    index_path = tmp_path / "capture.idx"
+    write_har(capture, ["/items", "/items?internal=1", "/other"])
+    index_main(["-i", str(capture), "-x", str(index_path), "-p", API_PREFIX])
+    args = pipeline.web2swagger_args(
+        str(capture),
+        API_PREFIX,
+        capture_index=str(index_path),
+        endpoint=["GET /items"],
+        exclude_url=["*internal*"],
+    )
+    swagger = generate_swagger(args, "test")
+    assert list(swagger["paths"]) == ["/items"]
+    assert swagger["paths"]["/items"]["get"].get("parameters", []) == []
+
+
+def test_endpoint_needs_a_capture_index(capsys):
+    with pytest.raises(SystemExit):
+        parse_args(
+            ["-i", "capture.har", "-o", "api.yaml", "-p", API_PREFIX, "--endpoint", "GET /items"]
+        )
+    assert "--capture-index" in capsys.readouterr().err
@@ -0,0 +1,60 @@
+import json
+import sqlite3
+
+from web2sdk import pipeline
+from web2sdk.web2swagger.main import generate_swagger
+
+API_PREFIX = "https://api.example.com"
+
+
+def write_har(file_path, bodies):
+    entries = [
+        {
+            "request": {"method": "GET", "url": f"{API_PREFIX}/items", "headers": []},
+            "response": {
+                "status": 200,
+                "statusText": "OK",
+                "headers": [{"name": "Content-Type", "value": "application/json"}],
+                "content": {"mimeType": "application/json", "text": json.dumps(body)},
+            },
+        }
+        for body in bodies
+    ]
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump({"log": {"entries": entries}}, f)
+
+
+def indexed_flows(spec_path):
+    connection = sqlite3.connect(str(spec_path) + ".index")
+    try:
+        return connection.execute("SELECT COUNT(*) FROM flows").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_sampled_out_flows_are_not_indexed(tmp_path):
+    capture = tmp_path / "capture.har"
+    spec_path = tmp_path / "spec.yaml"
+    write_har(capture, [{"id": i} for i in range(5)])
+    args = pipeline.web2swagger_args(
+        str(capture),
+        API_PREFIX,
+        str(spec_path),
+        incremental=True,
+        sample_per_endpoint=2,
+        sample_seed=0,
+    )
+    generate_swagger(args, "test")
+    assert indexed_flows(spec_path) == 2
+
+
+def test_already_processed_flows_are_skipped(tmp_path):
+    capture = tmp_path / "capture.har"
+    spec_path = tmp_path / "spec.yaml"
+    write_har(capture, [{"id": 1}, {"id": 1}, {"id": 2}])
+    args = pipeline.web2swagger_args(str(capture), API_PREFIX, str(spec_path), incremental=True)
+    generate_swagger(args, "test")
+    assert indexed_flows(spec_path) == 2
+    write_har(capture, [{"id": 1}, {"id": 2}, {"id": 3}])
+    generate_swagger(args, "test")
+    assert indexed_flows(spec_path) == 3
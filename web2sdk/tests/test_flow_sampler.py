@@ -0,0 +1,20 @@
+from web2sdk import profiling
+from web2sdk.web2swagger.flow_sampler import ReservoirSampler
+
+
+def test_sample_keeps_arrival_order():
+    sampler = ReservoirSampler(2, lambda flow: flow % 2, seed=0)
+    sample = list(sampler.sampled_flows(iter(range(10))))
+    assert len(sample) == 4
+    assert sample == sorted(sample)
+    assert sampler.dropped == 6
+
+
+def test_sampling_is_timed_as_its_own_stage():
+    sampler = ReservoirSampler(2, lambda flow: flow % 2, seed=0)
+    profiler = profiling.start()
+    try:
+        list(sampler.sampled_flows(iter(range(10))))
+    finally:
+        profiling.stop()
+    assert profiler.stages["sample"][0] == 10
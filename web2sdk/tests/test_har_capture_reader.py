@@ -0,0 +1,66 @@
+import base64
+
+from web2sdk import pipeline
+from web2sdk.tests import synthetic_captures
+from web2sdk.web2swagger import har_capture_reader
+from web2sdk.web2swagger.har_capture_reader import HarFlowWrapper
+from web2sdk.web2swagger.main import SwaggerBuilder, generate_swagger, new_swagger
+
+API_PREFIX = "https://api.example.com"
+
+
+def base64_flow(body: bytes, mime_type: str):
+    return HarFlowWrapper(
+        {
+            "request": {"method": "GET", "url": API_PREFIX + "/items", "headers": []},
+            "response": {
+                "status": 200,
+                "statusText": "OK",
+                "headers": [{"name": "Content-Type", "value": mime_type}],
+                "content": {
+                    "mimeType": mime_type,
+                    "encoding": "base64",
+                    "text": base64.b64encode(body).decode(),
+                },
+            },
+        }
+    )
+
+
+def response_content(flow):
+    swagger = new_swagger("test")
+    builder = SwaggerBuilder(swagger, API_PREFIX)
+    builder.add_flow(flow)
+    builder.finalize()
+    return swagger["paths"]["/items"]["get"]["responses"]["200"]["content"]
+
+
+def test_base64_bodies_are_decoded_as_bytes():
+    flow = base64_flow(b'{"id": 1}', "application/json")
+    assert flow.get_response_body() == b'{"id": 1}'
+    assert response_content(flow)["application/json"]["schema"] == {
+        "type": "object",
+        "properties": {"id": {"type": "number"}},
+    }
+
+
+def test_base64_bodies_that_are_not_utf_8_are_kept():
+    flow = base64_flow("café".encode("latin-1"), "text/plain")
+    assert flow.get_response_body() == "café".encode("latin-1")
+    assert "text/plain" in response_content(flow)
+
+
+def test_workers_infer_the_same_spec_as_a_single_process(tmp_path, monkeypatch):
+    capture = str(tmp_path / "capture.har")
+    synthetic_captures.write_har(capture, 300, endpoints=12)
+    # a few entries per shard, so the entries are spread over many shards
+    monkeypatch.setattr(har_capture_reader, "SHARD_SIZE", 8192)
+    specs = [
+        generate_swagger(
+            pipeline.web2swagger_args(capture, synthetic_captures.API_PREFIX, workers=workers),
+            "test",
+        )
+        for workers in (1, 3)
+    ]
+    assert len(specs[0]["paths"]) > 1
+    assert specs[1] == specs[0]
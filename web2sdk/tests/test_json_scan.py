@@ -0,0 +1,63 @@
+import json
+import random
+import re
+
+import pytest
+
+from web2sdk.web2swagger.json_scan import find_value_end
+
+# the scanner find_value_end replaced, one Python step per bracket
+_TOKEN_RE = re.compile(rb'("[^"\\]*(?:\\.[^"\\]*)*")|([{\[])|([}\]])|(")', re.DOTALL)
+
+
+def token_scan_value_end(buf, pos):
+    depth = 0
+    for m in _TOKEN_RE.finditer(buf, pos):
+        token = m.lastindex
+        if token == 1:
+            continue
+        if token == 2:
+            depth += 1
+        elif token == 3:
+            depth -= 1
+            if depth == 0:
+                return m.end()
+        else:
+            return -1
+    return -1
+
+
+def random_json(rng, depth):
+    kind = rng.randrange(6 if depth > 0 else 3)
+    if kind == 0:
+        return rng.choice([1, -2.5e3, True, None])
+    if kind == 1:
+        return "".join(rng.choice('ab"\\{}[] :,é\n') for _ in range(rng.randrange(6)))
+    if kind == 2:
+        return ""
+    if kind in (3, 4):
+        return [random_json(rng, depth - 1) for _ in range(rng.randrange(4))]
+    return {f"k{i}{rng.choice('{}[]')}": random_json(rng, depth - 1) for i in range(rng.randrange(4))}
+
+
+def random_bytes(rng):
+    return bytes(rng.choice(b'{}[]"\\ a,:') for _ in range(rng.randrange(1, 40)))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_find_value_end_matches_the_token_scanner(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        value = [random_json(rng, rng.randrange(1, 14))]
+        buf = json.dumps(value, ensure_ascii=rng.random() < 0.5).encode() + b' , {"x": 1}'
+        for data in (buf, bytearray(buf), buf[: rng.randrange(1, len(buf))]):
+            assert find_value_end(data, 0) == token_scan_value_end(data, 0)
+        # arbitrary bytes, including unbalanced brackets and unterminated strings
+        junk = bytes([rng.choice(b"{[")]) + random_bytes(rng)
+        assert find_value_end(junk, 0) == token_scan_value_end(junk, 0)
+
+
+def test_find_value_end_skips_deep_nesting():
+    buf = b"[" * 50 + b'"]"' + b"]" * 50 + b"rest"
+    assert find_value_end(buf, 0) == len(buf) - 4
+    assert find_value_end(buf[:-5], 0) == -1
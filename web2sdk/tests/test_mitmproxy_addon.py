@@ -0,0 +1,66 @@
+from mitmproxy.test import taddons, tflow
+
+from web2sdk import spec_io
+from web2sdk.web2swagger import mitmproxy_addon
+
+
+def json_flow(path, body):
+    flow = tflow.tflow(resp=True)
+    flow.request.url = "https://api.example.com" + path
+    flow.response.headers["Content-Type"] = "application/json"
+    flow.response.content = body
+    return flow
+
+
+def test_flush_writes_the_spec_and_passes_it_to_the_sdk_generator(tmp_path, monkeypatch):
+    generated = []
+    monkeypatch.setattr(
+        mitmproxy_addon,
+        "construct_sdk",
+        lambda swagger, sdk_name, output_dir, **kwargs: generated.append(swagger),
+    )
+    addon = mitmproxy_addon.Web2SwaggerAddon()
+    output = str(tmp_path / "api.yaml")
+    with taddons.context(addon) as tctx:
+        tctx.configure(
+            addon,
+            web2sdk_api_prefix="https://api.example.com",
+            web2sdk_output=output,
+            web2sdk_sdk_name="ExampleAPI",
+            web2sdk_flush_interval=3600.0,
+        )
+        addon.response(json_flow("/items", b'{"id": 1}'))
+        addon.flush()
+        # merged after the snapshot was taken
+        addon.response(json_flow("/users", b'{"id": 2}'))
+        addon.done()
+    assert list(spec_io.load_spec(output)["paths"]) == ["/items", "/users"]
+    assert [list(swagger["paths"]) for swagger in generated] == [
+        ["/items"],
+        ["/items", "/users"],
+    ]
+
+
+def test_flushes_keep_concrete_paths_like_the_cli(tmp_path):
+    addon = mitmproxy_addon.Web2SwaggerAddon()
+    output = str(tmp_path / "api.yaml")
+    # slugs don't look like ids, the segment only becomes a parameter after 20 distinct values
+    slugs = [a + b for a in "abcde" for b in "abcde"]
+    with taddons.context(addon) as tctx:
+        tctx.configure(
+            addon,
+            web2sdk_api_prefix="https://api.example.com",
+            web2sdk_output=output,
+            web2sdk_flush_interval=3600.0,
+        )
+        for slug in slugs:
+            addon.response(json_flow(f"/users/{slug}", b'{"id": 1}'))
+        addon.flush()
+        first = spec_io.load_spec(output)
+        addon.response(json_flow("/users/zz", b'{"id": 2}'))
+        addon.done()
+    paths = spec_io.load_spec(output)["paths"]
+    assert "/users/{user_id}" in paths
+    assert "/users/aa" in paths
+    # the concrete paths folded on the first flush are not merged into the template again
+    assert paths["/users/{user_id}"] == first["paths"]["/users/{user_id}"]
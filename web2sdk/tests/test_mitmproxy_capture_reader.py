@@ -0,0 +1,66 @@
+import itertools
+import threading
+
+import pytest
+
+from web2sdk.tests import synthetic_captures
+from web2sdk.web2swagger import mitmproxy_capture_reader
+from web2sdk.web2swagger.mitmproxy_capture_reader import MitmproxyCaptureReader
+
+
+@pytest.fixture
+def capture(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "capture.flow")
+    synthetic_captures.write_flow_dump(file_path, 60, endpoints=5)
+    # a few flows per shard, so the flows are spread over many shards
+    monkeypatch.setattr(mitmproxy_capture_reader, "SHARD_SIZE", 4096)
+    return file_path
+
+
+def urls(flows):
+    return [flow.get_url() for flow in flows]
+
+
+def test_parallel_reader_keeps_file_order(capture):
+    serial = urls(MitmproxyCaptureReader(capture).captured_requests())
+    parallel = urls(MitmproxyCaptureReader(capture, workers=2).captured_requests())
+    assert len(serial) == 60
+    assert parallel == serial
+
+
+def test_parallel_reader_reads_up_to_a_corruption(capture, monkeypatch):
+    serial = urls(MitmproxyCaptureReader(capture).captured_requests())
+    with open(capture, "ab") as f:
+        f.write(b"123:truncated")
+    # the flows before the corruption are all in the last, unfinished shard
+    monkeypatch.setattr(mitmproxy_capture_reader, "SHARD_SIZE", 1 << 30)
+    reader = MitmproxyCaptureReader(capture, workers=2)
+    assert urls(reader.captured_requests()) == serial
+
+
+def test_parallel_reader_raises_errors_of_the_reader_thread(capture, monkeypatch):
+    iter_raw_records = mitmproxy_capture_reader.iter_raw_records
+
+    def failing_records(stream):
+        yield from itertools.islice(iter_raw_records(stream), 10)
+        raise RuntimeError("disk on fire")
+
+    monkeypatch.setattr(mitmproxy_capture_reader, "iter_raw_records", failing_records)
+    reader = MitmproxyCaptureReader(capture, workers=2)
+    with pytest.raises(RuntimeError, match="disk on fire"):
+        list(reader.captured_requests())
+
+
+def test_parallel_reader_stops_when_the_consumer_does(capture, monkeypatch):
+    with open(capture, "rb") as f:
+        record = next(mitmproxy_capture_reader.iter_raw_records(f))
+    # a capture that never ends
+    monkeypatch.setattr(
+        mitmproxy_capture_reader, "iter_raw_records", lambda stream: itertools.repeat(record)
+    )
+    flows = MitmproxyCaptureReader(capture, workers=2).captured_requests()
+    next(flows)
+    closer = threading.Thread(target=flows.close, daemon=True)
+    closer.start()
+    closer.join(timeout=30)
+    assert not closer.is_alive()
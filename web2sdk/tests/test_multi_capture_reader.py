@@ -0,0 +1,20 @@
+from web2sdk.web2swagger.multi_capture_reader import expand_input_paths
+
+
+def test_directories_only_yield_capture_files(tmp_path):
+    for name in ["b.flow.gz", "a.HAR", "c.dump", "api.yaml", "api.yaml.index", "notes.txt", ".hidden.har"]:
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "nested.har").mkdir()
+    assert expand_input_paths(str(tmp_path)) == [
+        str(tmp_path / name) for name in ["a.HAR", "b.flow.gz", "c.dump"]
+    ]
+
+
+def test_explicit_files_and_globs_are_not_filtered(tmp_path):
+    (tmp_path / "capture.json").write_bytes(b"")
+    (tmp_path / "other.txt").write_bytes(b"")
+    assert expand_input_paths(str(tmp_path / "capture.json")) == [str(tmp_path / "capture.json")]
+    assert expand_input_paths(str(tmp_path / "*")) == [
+        str(tmp_path / "capture.json"),
+        str(tmp_path / "other.txt"),
+    ]
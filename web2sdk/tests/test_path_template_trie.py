@@ -0,0 +1,51 @@
+import random
+import re
+
+import pytest
+
+from web2sdk.web2swagger.path_template_trie import PathTemplateTrie, path_to_regex
+
+_SEGMENTS = ["users", "items", "v1", "{}", "{}", "{}.json", "x{}", "", "*"]
+_PATH_SEGMENTS = ["users", "items", "v1", "42", "a.json", "x1", "x", "", "b"]
+
+
+# the lookup the trie replaced: the first template in insertion order whose regex matches
+def linear_match(templates, path):
+    for template in templates:
+        if re.match(path_to_regex(template), path):
+            return template
+    return None
+
+
+def random_path(rng, segments):
+    return "/" + "/".join(rng.choice(segments) for _ in range(rng.randrange(0, 5)))
+
+
+# a random template, its parameters named p0, p1, ... so they don't clash in its regex
+def random_template(rng):
+    segments = [rng.choice(_SEGMENTS) for _ in range(rng.randrange(0, 5))]
+    return "/" + "/".join(segment.format(f"{{p{i}}}") for i, segment in enumerate(segments))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_trie_matches_the_first_matching_template(seed):
+    rng = random.Random(seed)
+    templates = []
+    for _ in range(rng.randrange(1, 40)):
+        template = random_template(rng)
+        if template not in templates:
+            templates.append(template)
+    trie = PathTemplateTrie(templates)
+    for _ in range(300):
+        path = random_path(rng, _PATH_SEGMENTS)
+        assert trie.match(path) == linear_match(templates, path), (templates, path)
+
+
+def test_earlier_templates_win():
+    trie = PathTemplateTrie(["/users/{id}", "/users/me", "/{kind}/me", "/users/{id}.json"])
+    assert trie.match("/users/me") == "/users/{id}"
+    assert trie.match("/items/me") == "/{kind}/me"
+    assert trie.match("/users/1.json") == "/users/{id}"
+    trie = PathTemplateTrie(["/users/me", "/{kind}/me", "/users/{id}"])
+    assert trie.match("/users/me") == "/users/me"
+    assert trie.match("/users/") is None
@@ -0,0 +1,146 @@
+import json
+
+from web2sdk.web2swagger.har_capture_reader import HarFlowWrapper
+from web2sdk.web2swagger.main import SwaggerBuilder, new_swagger
+from web2sdk.web2swagger.path_clustering import PathClusterer
+from web2sdk.web2swagger.schema_accumulator import SchemaNode, shape_fingerprint
+
+API_PREFIX = "https://api.example.com"
+
+
+def har_flow(method, path, response_body, status=200):
+    text = json.dumps(response_body)
+    return HarFlowWrapper(
+        {
+            "request": {"method": method, "url": API_PREFIX + path, "headers": []},
+            "response": {
+                "status": status,
+                "statusText": "OK",
+                "headers": [{"name": "Content-Type", "value": "application/json"}],
+                "content": {"mimeType": "application/json", "text": text},
+            },
+        }
+    )
+
+
+def response_schema(swagger, path, method="get", status="200"):
+    return swagger["paths"][path][method]["responses"][status]["content"][
+        "application/json"
+    ]["schema"]
+
+
+def test_samples_merge_into_one_schema():
+    node = SchemaNode()
+    node.add_sample({"id": 1, "name": "a"})
+    node.add_sample({"id": 2, "tags": ["x"]})
+    node.add_sample({"id": 3.5, "name": None})
+    assert node.to_schema() == {
+        "type": "object",
+        "properties": {
+            "id": {"type": "number"},
+            "name": {"type": "string", "nullable": True},
+            "tags": {"type": "array", "items": {"type": "string"}},
+        },
+        "required": ["id"],
+    }
+
+
+def test_mixed_types_become_one_of():
+    node = SchemaNode()
+    node.add_sample("a")
+    node.add_sample(1)
+    assert node.to_schema() == {"oneOf": [{"type": "string"}, {"type": "number"}]}
+
+
+def test_existing_schema_keeps_what_samples_cannot_tell():
+    swagger = new_swagger("test")
+    swagger["components"] = {"schemas": {"User": {"type": "object"}}}
+    swagger["paths"] = {
+        "/items": {
+            "get": {
+                "responses": {
+                    "200": {
+                        "description": "OK",
+                        "content": {
+                            "application/json": {
+                                "schema": {
+                                    "type": "object",
+                                    "description": "An item",
+                                    "required": ["id", "kind"],
+                                    "properties": {
+                                        "id": {"type": "integer", "minimum": 1},
+                                        "kind": {"type": "string", "enum": ["a", "b"]},
+                                        "owner": {"$ref": "#/components/schemas/User"},
+                                    },
+                                }
+                            }
+                        },
+                    }
+                }
+            }
+        }
+    }
+    builder = SwaggerBuilder(swagger, API_PREFIX)
+    builder.add_flow(
+        har_flow("GET", "/items", {"id": 7, "kind": "a", "owner": {"name": "x"}, "new": True})
+    )
+    builder.finalize()
+    assert response_schema(swagger, "/items") == {
+        "type": "object",
+        "properties": {
+            "id": {"type": "integer", "minimum": 1},
+            "kind": {"type": "string", "enum": ["a", "b"]},
+            "owner": {"$ref": "#/components/schemas/User"},
+            "new": {"type": "boolean"},
+        },
+        "required": ["id", "kind"],
+        "description": "An item",
+    }
+
+
+def test_existing_schema_widens_when_samples_disagree():
+    schema = {
+        "type": "object",
+        "required": ["id", "kind"],
+        "properties": {"id": {"type": "integer"}, "kind": {"type": "string"}},
+    }
+    node = SchemaNode.from_schema(schema)
+    node.add_sample({"id": 1.5})
+    assert node.to_schema() == {
+        "type": "object",
+        "properties": {"id": {"type": "number"}, "kind": {"type": "string"}},
+        "required": ["id"],
+    }
+
+
+def test_folding_concrete_paths_keeps_their_samples():
+    swagger = new_swagger("test")
+    builder = SwaggerBuilder(
+        swagger, API_PREFIX, path_clusterer=PathClusterer(cardinality_threshold=3)
+    )
+    builder.add_flow(har_flow("DELETE", "/users/alice", {"id": 0, "only_in_flow_0": True}))
+    builder.add_flow(har_flow("DELETE", "/users/bob", {"id": 1}))
+    builder.add_flow(har_flow("DELETE", "/users/carol", {"id": 2}))
+    # the template is learned from a method none of the concrete paths had, so the
+    # first concrete DELETE is moved to it and the others are merged into that
+    builder.add_flow(har_flow("GET", "/users/dave", {"id": 3}))
+    builder.finalize(keep_concrete=False)
+    assert list(swagger["paths"]) == ["/users/{user_id}"]
+    schema = response_schema(swagger, "/users/{user_id}", "delete")
+    assert set(schema["properties"]) == {"id", "only_in_flow_0"}
+    assert schema["required"] == ["id"]
+
+
+def test_fractional_sample_after_an_integral_float_widens_an_integer():
+    node = SchemaNode.from_schema(
+        {"type": "object", "properties": {"x": {"type": "integer"}}}
+    )
+    node.add_sample({"x": 1.0})
+    node.add_sample({"x": 1.5})
+    assert node.to_schema()["properties"]["x"] == {"type": "number"}
+
+
+def test_shapes_are_cached_by_their_whole_fingerprint():
+    assert shape_fingerprint({"x": 1.0}) != shape_fingerprint({"x": 1.5})
+    assert shape_fingerprint({"x": 1}) != shape_fingerprint({"x": 1.0})
+    assert isinstance(shape_fingerprint({"x": "a"}), tuple)
@@ -0,0 +1,19 @@
+from web2sdk.spec_io import dumps_spec, loads_spec
+
+
+def test_yaml_1_1_scalars_stay_strings():
+    spec = loads_spec("enum: [no, yes, on, off]\ntime: 12:30:00\non: x\n")
+    assert spec == {"enum": ["no", "yes", "on", "off"], "time": "12:30:00", "on": "x"}
+
+
+def test_core_schema_scalars():
+    spec = loads_spec("a: [true, False, ~, null, 017, 0o17, 0x1F, -3, 1.5, 1e5, .inf]\n")
+    assert spec["a"][:9] == [True, False, None, None, 17, 15, 31, -3, 1.5]
+    assert spec["a"][9] == 100000.0
+    assert spec["a"][10] == float("inf")
+
+
+def test_ambiguous_strings_round_trip():
+    values = ["no", "on", "12:30:00", "0o17", "017", "1e5", "true", "null", "1.5"]
+    text = dumps_spec({"enum": values})
+    assert loads_spec(text) == {"enum": values}
@@ -0,0 +1,43 @@
+import pytest
+
+from web2sdk.web2swagger.string_formats import classify, classify_all, string_format
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "2024-01-02T03:04:05Z",
+        "2024-01-02t03:04:05.123z",
+        "2024-01-02T03:04:05+02:00",
+        "2024-01-02T03:04:05.5-07:30",
+    ],
+)
+def test_rfc_3339_date_times(value):
+    assert classify(value) == "date-time"
+    assert string_format(value) == "date-time"
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "2024-01-02 03:04:05",
+        "2024-01-02T03:04:05",
+        "2024-01-02 03:04:05Z",
+        "2024-01-02T03:04:05+0200",
+        "2024-01-02",
+    ],
+)
+def test_date_times_need_a_t_and_a_time_zone(value):
+    assert classify(value) != "date-time"
+    assert string_format(value) == ""
+
+
+def test_other_formats():
+    assert classify("123e4567-e89b-12d3-a456-426614174000") == "uuid"
+    assert classify("-12") == "integer"
+    assert classify("1.5e3") == "number"
+    assert classify("someone@example.com") == "email"
+    assert classify("5f2b9c0e1a3d4e6f") == "hex"
+    assert classify("hello") is None
+    assert classify_all(["1", "2.5"]) == "number"
+    assert classify_all(["1", "a"]) is None
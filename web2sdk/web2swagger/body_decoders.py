@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Decodes request and response bodies, picking the decoder from the Content-Type header.
+
+Bodies without a usable header are sniffed from their first byte, so a
+binary body is never run through the JSON parser just to fail. JSON is
+parsed with orjson or msgspec when one of them is installed.
+"""
+import json
+import urllib.parse
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import msgpack
+
+from web2sdk import profiling
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+Body = Union[str, bytes]
+
+if orjson is not None:
+    JSON_BACKEND = "orjson"
+    _fast_json_loads = orjson.loads
+    _FAST_JSON_ERRORS: Tuple[type, ...] = (orjson.JSONDecodeError,)
+elif msgspec is not None:
+    JSON_BACKEND = "msgspec"
+    _fast_json_loads = msgspec.json.decode
+    _FAST_JSON_ERRORS = (msgspec.DecodeError,)
+else:
+    JSON_BACKEND = "json"
+    _fast_json_loads = None
+    _FAST_JSON_ERRORS = ()
+
+# the bytes a JSON document can start with, after whitespace
+_JSON_START = frozenset(b'{["-0123456789tfn')
+_WHITESPACE = b" \t\r\n"
+# the msgpack type bytes of maps and arrays, bodies are practically always one of them
+_MSGPACK_CONTAINER_START = frozenset(range(0x80, 0xA0)) | frozenset(range(0xDC, 0xE0))
+
+
+def decode_json(body: Body):
+    if _fast_json_loads is not None:
+        try:
+            return _fast_json_loads(body)
+        except _FAST_JSON_ERRORS:
+            # integers beyond 64 bits, NaN and the like are only accepted by the json
+            # module, bodies that aren't JSON at all aren't worth a second attempt
+            if sniff_media_type(body) != "application/json":
+                raise
+    return json.loads(body)
+
+
+def decode_msgpack(body: Body):
+    return msgpack.loads(body)
+
+
+def decode_form(body: Body):
+    pairs = urllib.parse.parse_qsl(body, keep_blank_values=True)
+    if len(pairs) == 0:
+        return None
+    if isinstance(body, str):
+        return dict(pairs)
+    # parse_qsl splits bytes without decoding them, only the keys and values are decoded
+    return {key.decode("utf-8"): value.decode("utf-8") for key, value in pairs}
+
+
+# media type -> (the content type the body is recorded under in the spec, decoder)
+DECODERS: Dict[str, Tuple[str, Callable[[Body], Any]]] = {}
+
+
+def register_decoder(media_type: str, content_type: str, decoder: Callable[[Body], Any]):
+    """Decode bodies sent as media_type with decoder, recording them under content_type.
+
+    A decoder raises an exception, or returns None, if it can't decode a body.
+    """
+    DECODERS[media_type] = (content_type, decoder)
+
+
+register_decoder("application/json", "application/json", decode_json)
+register_decoder("text/json", "application/json", decode_json)
+register_decoder("application/msgpack", "application/msgpack", decode_msgpack)
+register_decoder("application/x-msgpack", "application/msgpack", decode_msgpack)
+register_decoder(
+    "application/x-www-form-urlencoded", "application/x-www-form-urlencoded", decode_form
+)
+
+
+# "application/vnd.api+json; charset=utf-8" -> the decoder of application/json
+def decoder_for(content_type: Optional[str]) -> Optional[Tuple[str, Callable[[Body], Any]]]:
+    if not content_type:
+        return None
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    entry = DECODERS.get(media_type)
+    if entry is None and "+" in media_type:
+        entry = DECODERS.get("application/" + media_type.rsplit("+", 1)[1])
+    return entry
+
+
+# guess the media type of a body from its first significant byte
+def sniff_media_type(body: Body) -> Optional[str]:
+    if isinstance(body, str):
+        stripped = body.lstrip()
+        if stripped and ord(stripped[0]) in _JSON_START:
+            return "application/json"
+        return None
+    stripped = body.lstrip(_WHITESPACE)
+    if not stripped:
+        return None
+    if stripped[0] in _JSON_START:
+        return "application/json"
+    if body[0] in _MSGPACK_CONTAINER_START:
+        return "application/msgpack"
+    return None
+
+
+def header_value(headers: Dict[str, List[str]], name: str) -> Optional[str]:
+    for key, values in headers.items():
+        if key.lower() == name and len(values) > 0:
+            return values[0]
+    return None
+
+
+def decode_body(
+    body: Body, content_type: Optional[str] = None, form: bool = False
+) -> Optional[Tuple[str, Any]]:
+    """Return the content type and decoded value of body, or None if no decoder accepts it.
+
+    The decoder of the Content-Type header is tried first, then the one
+    the body is sniffed as. With form, bodies are parsed as url encoded
+    forms as a last resort. Failed attempts are counted by content type
+    when profiling.
+    """
+    with profiling.stage("decode"):
+        tried = []
+        candidates = [decoder_for(content_type), DECODERS.get(sniff_media_type(body) or "")]
+        if form:
+            candidates.append(DECODERS["application/x-www-form-urlencoded"])
+        for entry in candidates:
+            if entry is None or entry in tried:
+                continue
+            tried.append(entry)
+            recorded_type, decoder = entry
+            try:
+                value = decoder(body)
+            except Exception:
+                profiling.count("decode_failures." + recorded_type)
+                continue
+            if value is not None:
+                profiling.count("bytes_decoded", len(body))
+                return recorded_type, value
+        return None
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Opens capture files, decompressing gzip, xz and zstd archives on the fly."""
+import gzip
+import io
+import lzma
+import os
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+COMPRESSED_EXTENSIONS = (".gz", ".xz", ".zst", ".zstd")
+
+
+# detect the compression format from the magic bytes at the start of the file
+def detect_compression(file_path: str) -> Optional[str]:
+    with open(file_path, "rb") as f:
+        magic = f.read(6)
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic.startswith(XZ_MAGIC):
+        return "xz"
+    if magic.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+# capture.har.gz -> capture.har, so extension based heuristics still apply
+def strip_compression_extension(file_path: str) -> str:
+    for extension in COMPRESSED_EXTENSIONS:
+        if file_path.endswith(extension):
+            return file_path[: -len(extension)]
+    return file_path
+
+
+class CaptureFile:
+    """A capture opened for binary reading.
+
+    `stream` yields the decompressed bytes, while `progress()` reports how
+    far into the file on disk the reader is, so progress is based on
+    compressed offsets and needs no knowledge of the uncompressed size.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.compression = detect_compression(file_path)
+        self.size = os.path.getsize(file_path)
+        self.raw = None
+        self.stream = None
+
+    def __enter__(self) -> "CaptureFile":
+        self.raw = open(self.file_path, "rb")
+        if self.compression == "gzip":
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode="rb")
+        elif self.compression == "xz":
+            self.stream = lzma.LZMAFile(self.raw, mode="rb")
+        elif self.compression == "zstd":
+            if zstandard is None:
+                self.raw.close()
+                raise ValueError(
+                    f"{self.file_path} is zstd compressed. Install the 'zstandard' package to read it."
+                )
+            # buffered, so read(n) always returns n bytes until the end of the stream
+            self.stream = io.BufferedReader(
+                zstandard.ZstdDecompressor().stream_reader(self.raw, closefd=False)
+            )
+        else:
+            self.stream = self.raw
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.raw.close()
+
+    def progress(self) -> float:
+        if self.size == 0:
+            return 1.0
+        return self.raw.tell() / self.size
+
+
+# the first n decompressed bytes of a capture, for the format heuristics
+def read_capture_head(file_path: str, n: int = 2048) -> bytes:
+    with CaptureFile(file_path) as capture:
+        return capture.stream.read(n)
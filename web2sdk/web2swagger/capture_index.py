@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""An on-disk index of where each flow of a capture file is stored, by endpoint."""
+import os
+import sqlite3
+from itertools import groupby
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from web2sdk.web2swagger.flow_filter import FlowFilter
+from web2sdk.web2swagger.har_capture_reader import HarCaptureReader
+from web2sdk.web2swagger.mitmproxy_capture_reader import MitmproxyCaptureReader
+
+# reader class by the name() of the reader that indexed the capture
+READERS = {
+    "har": HarCaptureReader,
+    "flow": MitmproxyCaptureReader,
+}
+
+
+# the offset, length, method, path below the api prefix and status of a flow in a capture
+ScannedFlow = Tuple[int, int, str, str, int]
+
+
+def scan_capture(reader, api_prefix: str) -> List[ScannedFlow]:
+    """Find every flow of the capture read by reader whose URL starts with api_prefix.
+
+    Kept apart from CaptureIndex.add_capture, so path templates can be
+    learned from the flows of every capture before any flow is stored.
+    """
+    flows = []
+    for offset, length, flow in reader.iter_indexed_flows():
+        url = flow.get_matching_url(api_prefix)
+        if url is None:
+            continue
+        flows.append(
+            (
+                offset,
+                length,
+                flow.get_method().lower(),
+                url.split("?")[0].removeprefix(api_prefix),
+                flow.get_response_status_code(),
+            )
+        )
+    return flows
+
+
+class CaptureIndex:
+    """The byte offset, length, method, path template and status of every flow.
+
+    Built once per capture with `add_capture`, after which the flows of a
+    single endpoint can be read back with a seek per flow instead of a scan
+    of the whole file.
+    """
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self.connection = sqlite3.connect(index_path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS captures ("
+            "id INTEGER PRIMARY KEY, path TEXT UNIQUE, format TEXT, size INTEGER, mtime REAL)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS flows ("
+            "capture_id INTEGER, offset INTEGER, length INTEGER, "
+            "method TEXT, path_template TEXT, status INTEGER)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS flows_by_endpoint "
+            "ON flows (path_template, method, status)"
+        )
+
+    def add_capture(
+        self,
+        reader,
+        flows: Sequence[ScannedFlow],
+        match_path_template: Callable[[str], str] = lambda path: path,
+    ) -> int:
+        """Index the flows that scan_capture found in the capture read by reader.
+
+        Replaces any earlier index of the same file. Returns the number of
+        flows that were indexed.
+        """
+        path = os.path.abspath(reader.file_path)
+        self.remove_capture(path)
+        stat = os.stat(path)
+        cursor = self.connection.execute(
+            "INSERT INTO captures (path, format, size, mtime) VALUES (?, ?, ?, ?)",
+            (path, reader.name(), stat.st_size, stat.st_mtime),
+        )
+        capture_id = cursor.lastrowid
+        self.connection.executemany(
+            "INSERT INTO flows VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (capture_id, offset, length, method, match_path_template(flow_path), status)
+                for offset, length, method, flow_path, status in flows
+            ),
+        )
+        return len(flows)
+
+    def remove_capture(self, path: str):
+        row = self.connection.execute(
+            "SELECT id FROM captures WHERE path = ?", (path,)
+        ).fetchone()
+        if row is not None:
+            self.connection.execute("DELETE FROM flows WHERE capture_id = ?", row)
+            self.connection.execute("DELETE FROM captures WHERE id = ?", row)
+
+    def is_current(self, file_path: str) -> bool:
+        """True if the file is indexed and has not changed since."""
+        row = self.connection.execute(
+            "SELECT size, mtime FROM captures WHERE path = ?",
+            (os.path.abspath(file_path),),
+        ).fetchone()
+        if row is None:
+            return False
+        stat = os.stat(file_path)
+        return row == (stat.st_size, stat.st_mtime)
+
+    def endpoints(self) -> List[Tuple[str, str, int, int]]:
+        """The (method, path template, status, flow count) of every indexed endpoint."""
+        return self.connection.execute(
+            "SELECT method, path_template, status, COUNT(*) FROM flows "
+            "GROUP BY path_template, method, status ORDER BY path_template, method, status"
+        ).fetchall()
+
+    def locate(
+        self,
+        path_template: Optional[str] = None,
+        method: Optional[str] = None,
+        status: Optional[int] = None,
+        file_paths: Optional[Sequence[str]] = None,
+    ) -> Iterator[Tuple[str, str, int, int]]:
+        """Yield the (file path, format, offset, length) of the matching flows, in file order."""
+        query = (
+            "SELECT captures.path, captures.format, flows.offset, flows.length "
+            "FROM flows JOIN captures ON captures.id = flows.capture_id WHERE 1"
+        )
+        params: list = []
+        if path_template is not None:
+            query += " AND flows.path_template = ?"
+            params.append(path_template)
+        if method is not None:
+            query += " AND flows.method = ?"
+            params.append(method.lower())
+        if status is not None:
+            query += " AND flows.status = ?"
+            params.append(status)
+        if file_paths is not None:
+            query += " AND captures.path IN ({})".format(",".join("?" * len(file_paths)))
+            params.extend(os.path.abspath(path) for path in file_paths)
+        query += " ORDER BY captures.path, flows.offset"
+        yield from self.connection.execute(query, params)
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+# parse an endpoint given as "/path/{template}" or "METHOD /path/{template}"
+def parse_endpoint(endpoint: str) -> Tuple[Optional[str], str]:
+    parts = endpoint.split(None, 1)
+    if len(parts) == 2:
+        return parts[0].lower(), parts[1]
+    return None, endpoint
+
+
+class IndexedCaptureReader:
+    """Reads only the flows of the given endpoints, seeking to them through a CaptureIndex.
+
+    The flows are checked against flow_filter as they are read, so the
+    include and exclude options apply the same as without an index.
+    """
+
+    def __init__(
+        self,
+        index: CaptureIndex,
+        endpoints: Sequence[str],
+        file_paths: Optional[Sequence[str]] = None,
+        progress_callback=None,
+        flow_filter: Optional[FlowFilter] = None,
+    ):
+        self.index = index
+        self.endpoints = [parse_endpoint(endpoint) for endpoint in endpoints]
+        self.file_paths = file_paths
+        self.progress_callback = progress_callback
+        self.flow_filter = flow_filter
+
+    def captured_requests(self) -> Iterator:
+        locations = []
+        # no endpoints selects every indexed flow
+        for method, path_template in self.endpoints or [(None, None)]:
+            locations.extend(
+                self.index.locate(
+                    path_template=path_template, method=method, file_paths=self.file_paths
+                )
+            )
+        locations.sort()
+        done = 0
+        # read each capture in one pass, in file order
+        for (file_path, file_format), group in groupby(locations, key=lambda l: l[:2]):
+            reader = READERS[file_format](file_path, flow_filter=self.flow_filter)
+            for flow in reader.read_flows_at([(offset, length) for _, _, offset, length in group]):
+                done += 1
+                if self.progress_callback:
+                    self.progress_callback(done / len(locations))
+                yield flow
+
+    def name(self):
+        return "index"
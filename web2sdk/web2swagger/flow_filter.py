@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import fnmatch
+import re
+from typing import Optional, Sequence
+
+
+# compile a list of glob patterns into a single case-sensitive regex
+def globs_to_regex(globs: Optional[Sequence[str]]) -> Optional[re.Pattern]:
+    if not globs:
+        return None
+    return re.compile("|".join(fnmatch.translate(glob) for glob in globs))
+
+
+class FlowFilter:
+    """Decides from cheap metadata whether a captured flow is worth decoding.
+
+    The capture readers consult it before building a flow wrapper, so
+    entries outside the API prefix, or with an unwanted MIME or resource
+    type, never have their headers or bodies decoded.
+    """
+
+    def __init__(
+        self,
+        api_prefix: Optional[str] = None,
+        include_urls: Optional[Sequence[str]] = None,
+        exclude_urls: Optional[Sequence[str]] = None,
+        mime_types: Optional[Sequence[str]] = None,
+        resource_types: Optional[Sequence[str]] = None,
+    ):
+        self.api_prefix = api_prefix
+        self.include_urls = globs_to_regex(include_urls)
+        self.exclude_urls = globs_to_regex(exclude_urls)
+        self.mime_types = globs_to_regex(mime_types)
+        self.resource_types = (
+            set(resource_type.lower() for resource_type in resource_types)
+            if resource_types
+            else None
+        )
+
+    def accepts_url(self, url: Optional[str]) -> bool:
+        if url is None:
+            return False
+        if self.api_prefix is not None and not url.startswith(self.api_prefix):
+            return False
+        if self.include_urls is not None and not self.include_urls.match(url):
+            return False
+        if self.exclude_urls is not None and self.exclude_urls.match(url):
+            return False
+        return True
+
+    def accepts_mime_type(self, mime_type: Optional[str]) -> bool:
+        # flows without a recorded MIME type are kept
+        if self.mime_types is None or not mime_type:
+            return True
+        return self.mime_types.match(mime_type.split(";")[0].strip().lower()) is not None
+
+    def accepts_resource_type(self, resource_type: Optional[str]) -> bool:
+        if self.resource_types is None or not resource_type:
+            return True
+        return resource_type.lower() in self.resource_types
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""A sidecar index of the flows that were already merged into an OpenAPI spec."""
+import hashlib
+import os
+import sqlite3
+from typing import Iterator, Optional, Union
+
+# how many leading bytes identify a capture file when checking it was only appended to
+HEAD_SIZE = 4096
+
+
+def _body_bytes(body: Union[str, bytes, None]) -> bytes:
+    if body is None:
+        return b""
+    if isinstance(body, str):
+        return body.encode("utf-8", "surrogatepass")
+    return body
+
+
+# a 16 byte digest of the method, URL, status and both bodies of a flow
+def flow_fingerprint(req) -> bytes:
+    if req.fingerprint is None:
+        req.fingerprint = _compute_flow_fingerprint(req)
+    return req.fingerprint
+
+
+def _compute_flow_fingerprint(req) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    for part in (
+        req.get_method().encode(),
+        req.get_url().encode(),
+        str(req.get_response_status_code()).encode(),
+        hashlib.blake2b(_body_bytes(req.get_request_body()), digest_size=16).digest(),
+        hashlib.blake2b(_body_bytes(req.get_response_body()), digest_size=16).digest(),
+    ):
+        # length prefix each part so ("ab", "c") and ("a", "bc") differ
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.digest()
+
+
+class DuplicateFlowFilter:
+    """Drops flows that are identical to one seen earlier in the same run.
+
+    Polling endpoints produce thousands of byte-identical flows, which
+    would otherwise each be parsed and passed through schema inference.
+    """
+
+    def __init__(self):
+        self.seen = set()
+        self.dropped = 0
+
+    def unique_flows(self, flows: Iterator) -> Iterator:
+        for req in flows:
+            fingerprint = flow_fingerprint(req)
+            if fingerprint in self.seen:
+                self.dropped += 1
+                continue
+            self.seen.add(fingerprint)
+            yield req
+
+
+def _file_head_hash(file_path: str) -> bytes:
+    with open(file_path, "rb") as f:
+        return hashlib.blake2b(f.read(HEAD_SIZE), digest_size=16).digest()
+
+
+class FlowIndex:
+    """Fingerprints of processed flows, plus how far each capture file was read.
+
+    New fingerprints and offsets are only committed by `commit()`, after the
+    spec has been written, so an interrupted run does not mark flows as seen.
+    """
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self.connection = sqlite3.connect(index_path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS flows (fingerprint BLOB PRIMARY KEY) WITHOUT ROWID"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS captures ("
+            "path TEXT PRIMARY KEY, head_hash BLOB, offset INTEGER)"
+        )
+        self.skipped = 0
+
+    def clear(self):
+        self.connection.execute("DELETE FROM flows")
+        self.connection.execute("DELETE FROM captures")
+
+    def add(self, fingerprint: bytes) -> bool:
+        """Record a fingerprint, returning False if it was already in the index."""
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO flows (fingerprint) VALUES (?)", (fingerprint,)
+        )
+        return cursor.rowcount == 1
+
+    def __contains__(self, fingerprint: bytes) -> bool:
+        return (
+            self.connection.execute(
+                "SELECT 1 FROM flows WHERE fingerprint = ?", (fingerprint,)
+            ).fetchone()
+            is not None
+        )
+
+    def new_flows(self, flows: Iterator) -> Iterator:
+        """Skip flows that are already in the index.
+
+        Flows are not recorded here, the caller `add`s the ones it actually
+        merged into the spec.
+        """
+        for req in flows:
+            if flow_fingerprint(req) in self:
+                self.skipped += 1
+            else:
+                yield req
+
+    def resume_offset(self, file_path: str) -> int:
+        """Where to continue reading an append-only capture, 0 to read it from the start."""
+        row = self.connection.execute(
+            "SELECT head_hash, offset FROM captures WHERE path = ?",
+            (os.path.abspath(file_path),),
+        ).fetchone()
+        if row is None:
+            return 0
+        head_hash, offset = row
+        # the file was rewritten rather than appended to
+        if os.path.getsize(file_path) < offset or _file_head_hash(file_path) != head_hash:
+            return 0
+        return offset
+
+    def record_capture(self, file_path: str, offset: Optional[int]):
+        if not offset:
+            return
+        self.connection.execute(
+            "INSERT OR REPLACE INTO captures (path, head_hash, offset) VALUES (?, ?, ?)",
+            (os.path.abspath(file_path), _file_head_hash(file_path), offset),
+        )
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import random
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from web2sdk import profiling
+
+
+class ReservoirSampler:
+    """Keeps a uniform random sample of at most `budget` flows per endpoint.
+
+    Flows are keyed by `endpoint_key`, which must only look at cheap
+    metadata such as the method, URL and status. Flows that are dropped from
+    a reservoir never have their bodies decoded. Endpoints with fewer than
+    `budget` flows keep all of them.
+
+    The sample is only known once every flow was seen, so sampled_flows
+    reads all of its input before it yields the first flow, and holds up
+    to `budget` flows per endpoint in memory until then.
+    """
+
+    def __init__(
+        self,
+        budget: int,
+        endpoint_key: Callable[[object], Optional[Hashable]],
+        seed: Optional[int] = None,
+    ):
+        self.budget = budget
+        self.endpoint_key = endpoint_key
+        self.random = random.Random(seed)
+        # endpoint -> (flows seen, [(position in the stream, flow)])
+        self.reservoirs: Dict[Hashable, Tuple[int, List[Tuple[int, object]]]] = {}
+        self.dropped = 0
+
+    def add(self, position: int, req):
+        key = self.endpoint_key(req)
+        if key is None:
+            return
+        seen, reservoir = self.reservoirs.get(key, (0, []))
+        seen += 1
+        if len(reservoir) < self.budget:
+            reservoir.append((position, req))
+        else:
+            # algorithm R: the new flow replaces a random one with probability budget / seen
+            j = self.random.randrange(seen)
+            if j < self.budget:
+                reservoir[j] = (position, req)
+            self.dropped += 1
+        self.reservoirs[key] = (seen, reservoir)
+
+    def sampled_flows(self, flows: Iterator) -> Iterator:
+        """Consume all of flows, then yield the sample in the order the flows arrived."""
+        for position, req in enumerate(flows):
+            with profiling.stage("sample"):
+                self.add(position, req)
+        sample = [
+            entry for _, reservoir in self.reservoirs.values() for entry in reservoir
+        ]
+        sample.sort(key=lambda entry: entry[0])
+        for _, req in sample:
+            yield req
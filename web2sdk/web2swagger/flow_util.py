@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""Helpers shared by the HAR and mitmproxy flow wrappers."""
+from typing import Dict, Iterable, List, Tuple
+
+
+class _Unset:
+    """Marks a memoized flow attribute that has not been computed yet."""
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        # pickle by reference, so identity checks still work on wrappers
+        # that were built in a worker process
+        return "UNSET"
+
+    def __repr__(self):
+        return "UNSET"
+
+
+UNSET = _Unset()
+
+
+# group (name, value) header pairs into a dict of lists, keeping repeated headers
+def headers_to_dict(pairs: Iterable[Tuple[str, str]]) -> Dict[str, List[str]]:
+    headers: Dict[str, List[str]] = {}
+    for k, v in pairs:
+        # create list on key if it does not exist
+        headers.setdefault(k, []).append(v)
+    return headers
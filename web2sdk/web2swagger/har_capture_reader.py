@@ -1,45 +1,86 @@
 # -*- coding: utf-8 -*-
-import os
+import binascii
+import io
+import json
+import mmap
+import re
 from base64 import b64decode
-from typing import Iterator, Union
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple, Union
 
 import json_stream
 
+from web2sdk import profiling
+from web2sdk.web2swagger.capture_file import (
+    CaptureFile,
+    read_capture_head,
+    strip_compression_extension,
+)
+from web2sdk.web2swagger.flow_filter import FlowFilter
+from web2sdk.web2swagger.flow_util import UNSET, headers_to_dict
+from web2sdk.web2swagger.json_scan import (
+    find_array_start,
+    iter_array_spans,
+    iter_stream_array_items,
+)
+
+# target size of the byte range handed to a worker process in parallel mode
+SHARD_SIZE = 4 * 1024 * 1024
+# how much of a memory-mapped capture is read before its pages are released
+RELEASE_INTERVAL = 64 * 1024 * 1024
+
 
 # a heuristic to determine if a file is a har archive
 def har_archive_heuristic(file_path: str) -> int:
     val = 0
     # if has the har extension
-    if file_path.endswith(".har"):
+    if strip_compression_extension(file_path).endswith(".har"):
         val += 25
-    # read the first 2048 bytes
-    with open(file_path, "rb") as f:
-        data = f.read(2048)
-        # if file contains only ascii characters after remove EOL characters
-        if (
-            data.decode("utf-8", "ignore")
-            .replace("\r", "")
-            .replace("\n", "")
-            .isprintable()
-            is True
-        ):
-            val += 25
-        # sign of a JSON file
-        if data[0:1] == b"{":
-            val += 23
-        # sign of Chrome OR Firefox export
-        if b'"WebInspector"' in data or b'"Firefox"' in data:
-            val += 15
-        if b'"entries"' in data:
-            val += 15
-        if b'"version"' in data:
-            val += 15
+    # read the first 2048 (decompressed) bytes
+    data = read_capture_head(file_path, 2048)
+    # if file contains only ascii characters after remove EOL characters
+    if (
+        data.decode("utf-8", "ignore")
+        .replace("\r", "")
+        .replace("\n", "")
+        .isprintable()
+        is True
+    ):
+        val += 25
+    # sign of a JSON file
+    if data[0:1] == b"{":
+        val += 23
+    # sign of Chrome OR Firefox export
+    if b'"WebInspector"' in data or b'"Firefox"' in data:
+        val += 15
+    if b'"entries"' in data:
+        val += 15
+    if b'"version"' in data:
+        val += 15
     return val
 
 
 class HarFlowWrapper:
+    """Wraps a HAR entry. Headers and bodies are decoded on first use and memoized."""
+
+    __slots__ = (
+        "flow",
+        "_request_headers",
+        "_request_body",
+        "_response_headers",
+        "_response_body",
+        "fingerprint",
+    )
+
     def __init__(self, flow: dict):
         self.flow = flow
+        self._request_headers = UNSET
+        self._request_body = UNSET
+        self._response_headers = UNSET
+        self._response_body = UNSET
+        # memoized by flow_index.flow_fingerprint
+        self.fingerprint = None
 
     def get_url(self):
         return self.flow["request"]["url"]
@@ -54,22 +95,22 @@ class HarFlowWrapper:
         return self.flow["request"]["method"]
 
     def get_request_headers(self):
-        headers = {}
-        for kv in self.flow["request"]["headers"]:
-            k = kv["name"]
-            v = kv["value"]
-            # create list on key if it does not exist
-            headers[k] = headers.get(k, [])
-            headers[k].append(v)
+        if self._request_headers is UNSET:
+            self._request_headers = headers_to_dict(
+                (kv["name"], kv["value"]) for kv in self.flow["request"]["headers"]
+            )
+        return self._request_headers
 
     def get_request_body(self):
-        if (
-            "request" in self.flow
-            and "postData" in self.flow["request"]
-            and "text" in self.flow["request"]["postData"]
-        ):
-            return self.flow["request"]["postData"]["text"]
-        return None
+        if self._request_body is UNSET:
+            self._request_body = None
+            if (
+                "request" in self.flow
+                and "postData" in self.flow["request"]
+                and "text" in self.flow["request"]["postData"]
+            ):
+                self._request_body = self.flow["request"]["postData"]["text"]
+        return self._request_body
 
     def get_response_status_code(self):
         return self.flow["response"]["status"]
@@ -78,46 +119,286 @@ class HarFlowWrapper:
         return self.flow["response"]["statusText"]
 
     def get_response_headers(self):
-        headers = {}
-        for kv in self.flow["response"]["headers"]:
-            k = kv["name"]
-            v = kv["value"]
-            # create list on key if it does not exist
-            headers[k] = headers.get(k, [])
-            headers[k].append(v)
-        return headers
+        if self._response_headers is UNSET:
+            self._response_headers = headers_to_dict(
+                (kv["name"], kv["value"]) for kv in self.flow["response"]["headers"]
+            )
+        return self._response_headers
 
     def get_response_body(self):
+        if self._response_body is UNSET:
+            self._response_body = self._decode_response_body()
+        return self._response_body
+
+    def _decode_response_body(self):
         if (
             "response" in self.flow
             and "content" in self.flow["response"]
             and "text" in self.flow["response"]["content"]
         ):
-            try:
-                if (
-                    "encoding" in self.flow["response"]["content"]
-                    and self.flow["response"]["content"]["encoding"] == "base64"
-                ):
-                    return b64decode(self.flow["response"]["content"]["text"]).decode()
-            except UnicodeDecodeError:
-                return None
+            if (
+                "encoding" in self.flow["response"]["content"]
+                and self.flow["response"]["content"]["encoding"] == "base64"
+            ):
+                # left as bytes, the body decoders and the text fallback take bytes as well
+                try:
+                    return b64decode(self.flow["response"]["content"]["text"])
+                except binascii.Error:
+                    return None
             return self.flow["response"]["content"]["text"]
         return None
 
+    def digest(self):
+        """Decode everything up front and drop the raw body texts from the entry.
+
+        Used by worker processes, so the main process receives ready-to-use
+        wrappers and does not pay for pickling each body twice.
+        """
+        self.get_request_headers()
+        self.get_response_headers()
+        self.get_request_body()
+        self.get_response_body()
+        self.flow["request"].get("postData", {}).pop("text", None)
+        self.flow["response"].get("content", {}).pop("text", None)
+        return self
+
+
+# the request URL of an entry, as it appears in the raw JSON
+_REQUEST_URL_RE = re.compile(
+    rb'"request"\s*:\s*\{.*?"url"\s*:\s*"([^"\\]*(?:\\.[^"\\]*)*)"', re.DOTALL
+)
+
+
+# read the request URL of the entry in data[start:end] without parsing the entry
+def peek_request_url(data, start: int = 0, end: Optional[int] = None) -> Optional[str]:
+    m = _REQUEST_URL_RE.search(data, start, len(data) if end is None else end)
+    if m is None:
+        return None
+    raw_url = m.group(1)
+    if b"\\" in raw_url:
+        return json.loads(b'"' + raw_url + b'"')
+    return raw_url.decode("utf-8", "replace")
+
+
+# cheap check on the raw bytes of an entry, True if the entry might be wanted
+def raw_entry_passes_filter(data, start: int, end: int, flow_filter: Optional[FlowFilter]) -> bool:
+    if flow_filter is None:
+        return True
+    url = peek_request_url(data, start, end)
+    if url is None or flow_filter.accepts_url(url):
+        return True
+    profiling.count("flows_filtered")
+    return False
+
+
+# check a parsed entry before its headers or bodies are looked at
+def entry_passes_filter(entry, flow_filter: Optional[FlowFilter]) -> bool:
+    if flow_filter is None:
+        return True
+    request = entry.get("request") or {}
+    content = (entry.get("response") or {}).get("content") or {}
+    if (
+        flow_filter.accepts_url(request.get("url"))
+        and flow_filter.accepts_resource_type(entry.get("_resourceType"))
+        and flow_filter.accepts_mime_type(content.get("mimeType"))
+    ):
+        return True
+    profiling.count("flows_filtered")
+    return False
+
+
+# drop the pages of a read-only mapping below offset so they stop counting towards RSS
+def release_mapped_pages(buf: mmap.mmap, offset: int) -> None:
+    if hasattr(mmap, "MADV_DONTNEED"):
+        length = offset - offset % mmap.PAGESIZE
+        if length > 0:
+            buf.madvise(mmap.MADV_DONTNEED, 0, length)
+
+
+# group the entry spans into shards of roughly SHARD_SIZE bytes
+def iter_entry_shards(buf) -> Iterator[List[Tuple[int, int]]]:
+    shard: List[Tuple[int, int]] = []
+    released = 0
+    for start, end in iter_array_spans(buf, find_array_start(buf, b"entries")):
+        shard.append((start, end))
+        if end - shard[0][0] >= SHARD_SIZE:
+            yield shard
+            shard = []
+        if end - released >= RELEASE_INTERVAL:
+            release_mapped_pages(buf, end)
+            released = end
+    if shard:
+        yield shard
+
+
+# parse the entries at the given spans of data into flow wrappers
+def parse_entries(
+    data, spans: List[Tuple[int, int]], flow_filter: Optional[FlowFilter]
+) -> List[HarFlowWrapper]:
+    flows = []
+    for start, end in spans:
+        if not raw_entry_passes_filter(data, start, end, flow_filter):
+            continue
+        entry = json.loads(data[start:end])
+        if entry_passes_filter(entry, flow_filter):
+            flows.append(HarFlowWrapper(entry).digest())
+    return flows
+
+
+# runs in a worker process: parse one shard of an uncompressed file
+def read_entry_shard(
+    file_path: str,
+    shard: List[Tuple[int, int]],
+    flow_filter: Optional[FlowFilter] = None,
+) -> List[HarFlowWrapper]:
+    base = shard[0][0]
+    with open(file_path, "rb") as f:
+        f.seek(base)
+        data = f.read(shard[-1][1] - base)
+    return parse_entries(
+        data, [(start - base, end - base) for start, end in shard], flow_filter
+    )
+
+
+# runs in a worker process: parse entries that were already read out of a compressed file
+def parse_entry_blobs(
+    blobs: List[bytes], flow_filter: Optional[FlowFilter] = None
+) -> List[HarFlowWrapper]:
+    data = b"".join(blobs)
+    spans = []
+    start = 0
+    for blob in blobs:
+        spans.append((start, start + len(blob)))
+        start += len(blob)
+    return parse_entries(data, spans, flow_filter)
+
 
 class HarCaptureReader:
-    def __init__(self, file_path: str, progress_callback=None):
+    def __init__(
+        self,
+        file_path: str,
+        progress_callback=None,
+        workers: int = 1,
+        low_memory: bool = False,
+        flow_filter: Optional[FlowFilter] = None,
+    ):
         self.file_path = file_path
         self.progress_callback = progress_callback
+        self.workers = workers
+        self.low_memory = low_memory
+        self.flow_filter = flow_filter
 
     def captured_requests(self) -> Iterator[HarFlowWrapper]:
-        har_file_size = os.path.getsize(self.file_path)
-        with open(self.file_path, "r", encoding="utf-8") as f:
-            data = json_stream.load(f)
+        if self.workers > 1:
+            yield from self.captured_requests_parallel()
+            return
+        if self.low_memory:
+            yield from self.captured_requests_streaming()
+            return
+        with CaptureFile(self.file_path) as capture:
+            data = json_stream.load(io.TextIOWrapper(capture.stream, encoding="utf-8"))
             for entry in data["log"]["entries"].persistent():
                 if self.progress_callback:
-                    self.progress_callback(f.tell() / har_file_size)
-                yield HarFlowWrapper(entry)
+                    self.progress_callback(capture.progress())
+                if entry_passes_filter(entry, self.flow_filter):
+                    yield HarFlowWrapper(entry)
+
+    def captured_requests_streaming(self) -> Iterator[HarFlowWrapper]:
+        """Parse one entry at a time, from a memory map or a decompression stream.
+
+        Unlike the json_stream reader, nothing keeps a reference to earlier
+        entries, and pages of the mapping that were already scanned are
+        released, so peak memory is bounded by the largest single entry.
+        """
+        with CaptureFile(self.file_path) as capture:
+            if capture.compression is not None:
+                for data in iter_stream_array_items(capture.stream, b"entries"):
+                    if self.progress_callback:
+                        self.progress_callback(capture.progress())
+                    yield from parse_entries(data, [(0, len(data))], self.flow_filter)
+                return
+            with mmap.mmap(capture.raw.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                released = 0
+                for start, end in iter_array_spans(buf, find_array_start(buf, b"entries")):
+                    if self.progress_callback:
+                        self.progress_callback(end / capture.size)
+                    yield from parse_entries(buf, [(start, end)], self.flow_filter)
+                    if end - released >= RELEASE_INTERVAL:
+                        release_mapped_pages(buf, end)
+                        released = end
+
+    def captured_requests_parallel(self) -> Iterator[HarFlowWrapper]:
+        """Scan for entry boundaries here and parse the entries in a process pool.
+
+        Workers are handed byte ranges of uncompressed files, and the raw
+        entry bytes of compressed ones. Shards are yielded in file order, and
+        at most two shards per worker are in flight so a slow consumer does
+        not buffer the whole file.
+        """
+        with CaptureFile(self.file_path) as capture, ProcessPoolExecutor(
+            max_workers=self.workers
+        ) as pool:
+            pending: deque = deque()
+            for future, progress in self._submit_shards(capture, pool):
+                pending.append((future, progress))
+                if len(pending) >= self.workers * 2:
+                    yield from self._drain_shard(pending.popleft())
+            while pending:
+                yield from self._drain_shard(pending.popleft())
+
+    def _submit_shards(self, capture: CaptureFile, pool: ProcessPoolExecutor):
+        if capture.compression is None:
+            with mmap.mmap(capture.raw.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                for shard in iter_entry_shards(buf):
+                    future = pool.submit(
+                        read_entry_shard, self.file_path, shard, self.flow_filter
+                    )
+                    yield future, shard[-1][1] / capture.size
+            return
+        blobs: List[bytes] = []
+        blobs_size = 0
+        for blob in iter_stream_array_items(capture.stream, b"entries"):
+            blobs.append(blob)
+            blobs_size += len(blob)
+            if blobs_size >= SHARD_SIZE:
+                yield pool.submit(parse_entry_blobs, blobs, self.flow_filter), capture.progress()
+                blobs = []
+                blobs_size = 0
+        if blobs:
+            yield pool.submit(parse_entry_blobs, blobs, self.flow_filter), capture.progress()
+
+    def _drain_shard(self, pending_shard) -> Iterator[HarFlowWrapper]:
+        future, progress = pending_shard
+        flows = future.result()
+        if self.progress_callback:
+            self.progress_callback(progress)
+        yield from flows
+
+    def iter_indexed_flows(self) -> Iterator[Tuple[int, int, HarFlowWrapper]]:
+        """Yield the (offset, length, flow) of every entry, for capture_index."""
+        with CaptureFile(self.file_path) as capture:
+            if capture.compression is not None:
+                raise ValueError(
+                    f"Compressed captures can't be indexed, decompress '{self.file_path}' first"
+                )
+            with mmap.mmap(capture.raw.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                for start, end in iter_array_spans(buf, find_array_start(buf, b"entries")):
+                    if self.progress_callback:
+                        self.progress_callback(end / capture.size)
+                    for flow in parse_entries(buf, [(start, end)], self.flow_filter):
+                        yield start, end - start, flow
+
+    def read_flows_at(self, spans: List[Tuple[int, int]]) -> Iterator[HarFlowWrapper]:
+        """Read the entries at the given (offset, length) spans, as recorded by capture_index.
+
+        Entries the flow filter rejects are skipped, like in a full read.
+        """
+        with open(self.file_path, "rb") as f:
+            for offset, length in spans:
+                f.seek(offset)
+                entry = json.loads(f.read(length))
+                if entry_passes_filter(entry, self.flow_filter):
+                    yield HarFlowWrapper(entry)
 
     def name(self):
         return "har"
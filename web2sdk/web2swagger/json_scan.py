@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Helpers for locating JSON values in a byte buffer without parsing them."""
+import re
+from typing import BinaryIO, Iterator, Tuple
+
+_WHITESPACE_RE = re.compile(rb"[ \t\r\n]*")
+_STRING_PATTERN = rb'"[^"\\]*(?:\\.[^"\\]*)*"'
+
+# the contents of a container up to its closing bracket, as long as it nests no more than
+# _NESTED_DEPTH levels deeper. Lets the regex engine skip whole containers at once
+_NESTED_DEPTH = 8
+# written as runs of plain bytes between strings and containers, so the regex engine
+# never has more than one way to split the input and can't backtrack exponentially
+_PLAIN = rb'[^"\[\]{}]*'
+_nested_pattern = _PLAIN + rb"(?:" + _STRING_PATTERN + _PLAIN + rb")*"
+for _ in range(_NESTED_DEPTH):
+    _nested_pattern = (
+        _PLAIN
+        + rb"(?:(?:"
+        + _STRING_PATTERN
+        + rb"|[\[{]"
+        + _nested_pattern
+        + rb"[\]}])"
+        + _PLAIN
+        + rb")*"
+    )
+_NESTED_RE = re.compile(_nested_pattern, re.DOTALL)
+
+# how much is read from a stream at a time by iter_stream_array_items
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+def find_value_end(buf, pos: int) -> int:
+    """Return the offset just past the object or array that starts at pos.
+
+    Returns -1 if the buffer ends before the value is closed. Containers
+    are skipped by the regex engine, so only brackets nested deeper than
+    _NESTED_DEPTH levels cost a Python-level step.
+    """
+    if buf[pos : pos + 1] not in (b"{", b"["):
+        return -1
+    depth = 1
+    pos += 1
+    while True:
+        pos = _NESTED_RE.match(buf, pos).end()
+        c = buf[pos : pos + 1]
+        if c == b"}" or c == b"]":
+            depth -= 1
+            if depth == 0:
+                return pos + 1
+        elif c == b"{" or c == b"[":
+            depth += 1
+        else:
+            # the buffer ends, or a string runs past its end
+            return -1
+        pos += 1
+
+
+def skip_whitespace(buf, pos: int) -> int:
+    return _WHITESPACE_RE.match(buf, pos).end()
+
+
+def _array_start_re(key: bytes) -> re.Pattern:
+    return re.compile(rb'"' + re.escape(key) + rb'"\s*:\s*\[')
+
+
+def find_array_start(buf, key: bytes, pos: int = 0) -> int:
+    """Return the offset just past the "[" of the first array stored under key."""
+    m = _array_start_re(key).search(buf, pos)
+    if m is None:
+        raise ValueError(f"Could not find a {key.decode()!r} array in the input")
+    return m.end()
+
+
+def iter_array_spans(buf, pos: int) -> Iterator[Tuple[int, int]]:
+    """Yield the (start, end) offsets of each object in the array whose items start at pos."""
+    while True:
+        pos = skip_whitespace(buf, pos)
+        c = buf[pos : pos + 1]
+        if not c:
+            raise ValueError("Unterminated array at end of input")
+        if c == b"]":
+            return
+        if c == b",":
+            pos += 1
+            continue
+        if c != b"{":
+            raise ValueError(f"Unexpected {c!r} at offset {pos} while scanning array")
+        end = find_value_end(buf, pos)
+        if end == -1:
+            raise ValueError(f"Unterminated object at offset {pos}")
+        yield pos, end
+        pos = end
+
+
+def iter_stream_array_items(
+    stream: BinaryIO, key: bytes, chunk_size: int = STREAM_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Like iter_array_spans on the first array stored under key, but for a
+    stream that cannot be mapped into memory, such as a decompressor.
+
+    Yields the raw bytes of each object. Only the current object and one
+    chunk of lookahead are buffered.
+    """
+    buf = bytearray()
+    eof = False
+
+    def fill(size: int) -> None:
+        nonlocal eof
+        data = stream.read(size)
+        if not data:
+            eof = True
+        buf.extend(data)
+
+    array_start_re = _array_start_re(key)
+    while True:
+        m = array_start_re.search(buf)
+        if m is not None:
+            pos = m.end()
+            break
+        if eof:
+            raise ValueError(f"Could not find a {key.decode()!r} array in the input")
+        fill(chunk_size)
+
+    while True:
+        pos = skip_whitespace(buf, pos)
+        if pos == len(buf):
+            if eof:
+                raise ValueError("Unterminated array at end of input")
+            del buf[:pos]
+            pos = 0
+            fill(chunk_size)
+            continue
+        c = buf[pos : pos + 1]
+        if c == b"]":
+            return
+        if c == b",":
+            pos += 1
+            continue
+        if c != b"{":
+            raise ValueError(f"Unexpected {bytes(c)!r} while scanning array")
+        end = find_value_end(buf, pos)
+        if end == -1:
+            if eof:
+                raise ValueError("Unterminated object at end of input")
+            del buf[:pos]
+            pos = 0
+            # grow the read size with the object, so a huge object is not rescanned once per chunk
+            fill(max(chunk_size, len(buf)))
+            continue
+        yield bytes(buf[pos:end])
+        pos = end
+
@@ -2,34 +2,36 @@
 # -*- coding: utf-8 -*-
 """Converts a mitmproxy dump file to a swagger schema."""
 import argparse
-import json
+import copy
 import os
 import re
 import sys
 import traceback
-import urllib
-from typing import Any, Optional, Sequence, Union
+from typing import Any, Dict, Optional, Sequence, Set, Tuple
 
-import msgpack
-import ruamel.yaml
 from mitmproxy.exceptions import FlowReadException
 
-from web2sdk import console_util
-from web2sdk.web2swagger import swagger_util
+from web2sdk import console_util, profiling, spec_io
+from web2sdk.web2swagger import body_decoders, swagger_util
+from web2sdk.web2swagger.capture_index import CaptureIndex, IndexedCaptureReader, scan_capture
+from web2sdk.web2swagger.flow_filter import FlowFilter
+from web2sdk.web2swagger.flow_index import DuplicateFlowFilter, FlowIndex, flow_fingerprint
+from web2sdk.web2swagger.flow_sampler import ReservoirSampler
 from web2sdk.web2swagger.har_capture_reader import HarCaptureReader, har_archive_heuristic
 from web2sdk.web2swagger.mitmproxy_capture_reader import (
     MitmproxyCaptureReader,
     mitmproxy_dump_file_huristic,
 )
-
-
-def path_to_regex(path):
-    # replace the path template with a regex
-    path = re.escape(path)
-    path = path.replace(r"\{", "(?P<")
-    path = path.replace(r"\}", ">[^/]+)")
-    path = path.replace(r"\*", ".*")
-    return "^" + path + "$"
+from web2sdk.web2swagger.multi_capture_reader import (
+    MultiCaptureReader,
+    expand_input_paths,
+)
+from web2sdk.web2swagger.path_clustering import (
+    DEFAULT_CARDINALITY_THRESHOLD,
+    PathClusterer,
+)
+from web2sdk.web2swagger.path_template_trie import PathTemplateTrie
+from web2sdk.web2swagger.schema_accumulator import SchemaNode
 
 
 def strip_query_string(path):
@@ -46,30 +48,370 @@ def progress_callback(progress):
     console_util.print_progress_bar(progress, "Generating OpenAPI Schema...")
 
 
-def detect_input_format(file_path):
+def detect_input_format(file_path, workers=1, low_memory=False, flow_filter=None):
     har_score = har_archive_heuristic(file_path)
     mitmproxy_score = mitmproxy_dump_file_huristic(file_path)
     if "MITMPROXY2SWAGGER_DEBUG" in os.environ:
         print("har score: " + str(har_score))
         print("mitmproxy score: " + str(mitmproxy_score))
     if har_score > mitmproxy_score:
-        return HarCaptureReader(file_path, progress_callback)
-    return MitmproxyCaptureReader(file_path, progress_callback)
+        return HarCaptureReader(
+            file_path,
+            progress_callback,
+            workers=workers,
+            low_memory=low_memory,
+            flow_filter=flow_filter,
+        )
+    return MitmproxyCaptureReader(
+        file_path, progress_callback, flow_filter=flow_filter, workers=workers
+    )
 
-def main(sdk_name: str, override_args: Optional[Sequence[str]] = None):
+
+def make_capture_reader(file_path, args, flow_filter):
+    if args.format == "flow" or args.format == "mitmproxy":
+        return MitmproxyCaptureReader(
+            file_path, progress_callback, flow_filter=flow_filter, workers=args.workers
+        )
+    elif args.format == "har":
+        return HarCaptureReader(
+            file_path,
+            progress_callback,
+            workers=args.workers,
+            low_memory=args.low_memory,
+            flow_filter=flow_filter,
+        )
+    return detect_input_format(
+        file_path,
+        workers=args.workers,
+        low_memory=args.low_memory,
+        flow_filter=flow_filter,
+    )
+
+
+def new_swagger(title):
+    return {
+        "openapi": "3.0.0",
+        "info": {
+            "title ": title,
+            "version": "1.0.0",
+        },
+    }
+
+
+# make sure the sections the builder writes to exist
+def prepare_swagger(swagger, api_prefix):
+    if "servers" not in swagger or swagger["servers"] is None:
+        swagger["servers"] = []
+
+    # add the server if it doesn't exist
+    if not any(server["url"] == api_prefix for server in swagger["servers"]):
+        swagger["servers"].append(
+            {"url": api_prefix, "description": "The default server"}
+        )
+
+    if "paths" not in swagger or swagger["paths"] is None:
+        swagger["paths"] = {}
+
+    # Add the component/securitySchemes section if it doesn't exist
+    if "components" not in swagger or swagger["components"] is None:
+        swagger["components"] = {}
+
+
+# yield the location and object of every media type of an operation's request and responses
+def iter_media_types(operation):
+    request_body = operation.get("requestBody") or {}
+    for content_type, media_type in (request_body.get("content") or {}).items():
+        yield ("requestBody", "content", content_type), media_type
+    for status, response in (operation.get("responses") or {}).items():
+        for content_type, media_type in ((response or {}).get("content") or {}).items():
+            yield ("responses", status, "content", content_type), media_type
+
+
+class SwaggerBuilder:
+    """Merges captured flows into an OpenAPI spec, one flow at a time.
+
+    Used by generate_swagger() for capture files, and by the mitmproxy addon
+    for live traffic.
+    """
+
+    def __init__(
+        self,
+        swagger,
+        api_prefix: str,
+        examples=False,
+        headers=False,
+        path_clusterer: Optional[PathClusterer] = None,
+        max_depth: int = swagger_util.MAX_SCHEMA_DEPTH,
+        max_elements: int = swagger_util.MAX_SAMPLED_ELEMENTS,
+    ):
+        self.swagger = swagger
+        self.api_prefix = api_prefix
+        self.examples = examples
+        self.headers = headers
+        self.path_clusterer = path_clusterer
+        # bodies nested deeper than this are described as {} below the cap
+        self.max_depth = max_depth
+        # how many elements of each array in a body its item schema is inferred from
+        self.max_elements = max_elements
+        # id of a media type object in the spec -> (the object, the merged schema of its samples)
+        self.schema_nodes: Dict[int, Tuple[Any, SchemaNode]] = {}
+        # concrete paths that were kept after their operations were folded into a template
+        self.folded_paths: Set[str] = set()
+        prepare_swagger(swagger, api_prefix)
+        # add existing path templates
+        self.path_templates = PathTemplateTrie(swagger["paths"])
+
+    # the first existing path template the path matches, otherwise the
+    # learned template of the path, or the path itself. With learn, the
+    # path also counts towards the clustering thresholds
+    def match_path_template(self, path, learn=True):
+        path_template = self.path_templates.match(path)
+        if path_template is not None:
+            return path_template
+        if self.path_clusterer is not None:
+            return self.path_clusterer.cluster(path, learn=learn)
+        return path
+
+    # merge the operations of concrete paths into the templates learned after they were added
+    def fold_concrete_paths(self, keep_concrete=False):
+        if self.path_clusterer is None:
+            return
+        paths = self.swagger["paths"]
+        for path in list(paths):
+            # kept concrete paths get no more samples once folded, folding them again on a later
+            # finalize would count their samples twice
+            if "{" in path or path in self.folded_paths:
+                continue
+            path_template = self.path_clusterer.cluster(path, learn=False)
+            if path_template == path:
+                continue
+            set_key_if_not_exists(paths, path_template, {})
+            # operations whose samples went into an operation of the template
+            merged = []
+            for method, operation in paths[path].items():
+                if method in paths[path_template]:
+                    self.merge_operation_schemas(paths[path_template][method], operation)
+                    merged.append(operation)
+                    continue
+                if keep_concrete:
+                    concrete_operation = operation
+                    operation = copy.deepcopy(operation)
+                    self.merge_operation_schemas(operation, concrete_operation)
+                operation["summary"] = swagger_util.path_template_to_endpoint_name(
+                    method, path_template
+                )
+                parameters = swagger_util.url_to_params(path, path_template) + [
+                    param
+                    for param in operation.get("parameters", [])
+                    if param.get("in") != "path"
+                ]
+                if len(parameters) > 0:
+                    operation["parameters"] = parameters
+                paths[path_template][method] = operation
+            if keep_concrete:
+                self.folded_paths.add(path)
+            else:
+                # moved operations keep their nodes, they now belong to the template
+                for operation in merged:
+                    for _, media_type in iter_media_types(operation):
+                        self.schema_nodes.pop(id(media_type), None)
+                del paths[path]
+
+    # merge a decoded body into the schema of content[content_type]
+    def add_body_sample(self, content, content_type, value):
+        with profiling.stage("infer"):
+            if content_type not in content:
+                media_type = {"schema": {}}
+                # cut from the value decoded for the schema, which every body needs in full
+                if self.examples:
+                    media_type["example"] = swagger_util.limit_example_size(
+                        value, self.max_depth
+                    )
+                content[content_type] = media_type
+            self.schema_node(content[content_type]).add_sample(
+                value, self.max_depth, self.max_elements
+            )
+
+    # the accumulated schema of a media type object, seeded from its schema in the spec
+    def schema_node(self, media_type) -> SchemaNode:
+        entry = self.schema_nodes.get(id(media_type))
+        if entry is None:
+            entry = (media_type, SchemaNode.from_schema(media_type.get("schema")))
+            self.schema_nodes[id(media_type)] = entry
+        return entry[1]
+
+    # merge the body schemas of source into those of target, adding the ones target lacks
+    def merge_operation_schemas(self, target, source):
+        for location, media_type in iter_media_types(source):
+            target_container = target
+            source_container = source
+            for key in location:
+                source_container = source_container[key]
+                if key not in target_container:
+                    # copy descriptions, headers and examples, but not the other media types
+                    target_container[key] = (
+                        {}
+                        if key == "content"
+                        else {
+                            k: copy.deepcopy(v)
+                            for k, v in source_container.items()
+                            if k not in ("content", "schema")
+                        }
+                    )
+                target_container = target_container[key]
+            self.schema_node(target_container).merge(self.schema_node(media_type))
+
+    # write the accumulated schemas into the spec
+    def render_schemas(self):
+        for media_type, node in self.schema_nodes.values():
+            media_type["schema"] = node.to_schema()
+
+    def finalize(self, keep_concrete=False):
+        self.fold_concrete_paths(keep_concrete=keep_concrete)
+        self.render_schemas()
+
+    # the (path template, method, status) a flow belongs to, None if it is outside the api prefix
+    def endpoint_key(self, req):
+        url = req.get_matching_url(self.api_prefix)
+        if url is None:
+            return None
+        path = strip_query_string(url).removeprefix(self.api_prefix)
+        return (
+            self.match_path_template(path),
+            req.get_method().lower(),
+            req.get_response_status_code(),
+        )
+
+    def add_flow(self, req):
+        # strip the api prefix from the url
+        url = req.get_matching_url(self.api_prefix)
+
+        if url is None:
+            return
+        method = req.get_method().lower()
+        path = strip_query_string(url).removeprefix(self.api_prefix)
+        status = req.get_response_status_code()
+
+        with profiling.stage("match_path"):
+            path_template_to_set = self.match_path_template(path)
+
+        set_key_if_not_exists(self.swagger["paths"], path_template_to_set, {})
+
+        set_key_if_not_exists(
+            self.swagger["paths"][path_template_to_set],
+            method,
+            {
+                "summary": swagger_util.path_template_to_endpoint_name(
+                    method, path_template_to_set
+                ),
+                "responses": {},
+            },
+        )
+
+        params = swagger_util.url_to_params(url, path_template_to_set)
+        if self.headers:
+            headers_request = swagger_util.request_to_headers(
+                req.get_request_headers()
+            )
+            if headers_request is not None and len(headers_request) > 0:
+                set_key_if_not_exists(
+                    self.swagger["paths"][path_template_to_set][method],
+                    "parameters",
+                    headers_request,
+                )
+        if params is not None and len(params) > 0:
+            set_key_if_not_exists(
+                self.swagger["paths"][path_template_to_set][method], "parameters", params
+            )
+
+        if method not in ["get", "head"]:
+            body = req.get_request_body()
+            if body is not None:
+                decoded = body_decoders.decode_body(
+                    body,
+                    body_decoders.header_value(req.get_request_headers(), "content-type"),
+                    form=True,
+                )
+                if decoded is not None:
+                    content_type, body_val = decoded
+                    operation = self.swagger["paths"][path_template_to_set][method]
+                    set_key_if_not_exists(operation, "requestBody", {"content": {}})
+                    set_key_if_not_exists(operation["requestBody"], "content", {})
+                    self.add_body_sample(
+                        operation["requestBody"]["content"], content_type, body_val
+                    )
+
+        response_body = req.get_response_body()
+        if response_body is not None:
+            response_content_type = body_decoders.header_value(
+                req.get_response_headers(), "content-type"
+            )
+            decoded = body_decoders.decode_body(response_body, response_content_type)
+            response_parsed = None
+            if decoded is not None:
+                response_content_type, response_parsed = decoded
+
+            if response_parsed is None:
+                # try parsing the response as text
+                if type(response_body) is str:
+                    response_parsed = response_body
+                else:
+                    response_parsed = response_body.decode("utf-8", "ignore")
+                if response_content_type is None:
+                    response_content_type = "text/plain"
+
+            if response_parsed is not None:
+                responses = self.swagger["paths"][path_template_to_set][method][
+                    "responses"
+                ]
+                set_key_if_not_exists(
+                    responses,
+                    str(status),
+                    {"description": req.get_response_reason(), "content": {}},
+                )
+                response = responses[str(status)]
+                set_key_if_not_exists(response, "content", {})
+                self.add_body_sample(
+                    response["content"], response_content_type, response_parsed
+                )
+                if self.headers:
+                    set_key_if_not_exists(
+                        response,
+                        "headers",
+                        swagger_util.response_to_headers(req.get_response_headers()),
+                    )
+
+        if (
+            "responses" in self.swagger["paths"][path_template_to_set][method]
+            and len(self.swagger["paths"][path_template_to_set][method]["responses"])
+            == 0
+        ):
+            # add a default response if there were no responses detected,
+            # this is for compliance with the OpenAPI spec
+            self.swagger["paths"][path_template_to_set][method]["responses"]["200"] = {
+                "description": "OK",
+                "content": {},
+            }
+
+
+class CaptureError(Exception):
+    """The captures can't be read with the given options. Reported without a stack trace."""
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="Converts a mitmproxy dump file or HAR to a swagger schema."
     )
     parser.add_argument(
         "-i",
         "--input",
-        help="The input mitmproxy dump file or HAR dump file (from DevTools)",
+        help="The input mitmproxy dump file or HAR dump file (from DevTools). Can also be a directory or a glob pattern, in which case all matching captures are read concurrently.",
         required=True,
     )
     parser.add_argument(
         "-o",
         "--output",
-        help="The output swagger schema file (yaml). If it exists, new endpoints will be added",
+        help="The output swagger schema file (yaml, or json if it ends in .json). If it exists, new endpoints will be added",
         required=True,
     )
     parser.add_argument("-p", "--api-prefix", help="The api prefix", required=True)
@@ -91,294 +433,386 @@ def main(sdk_name: str, override_args: Optional[Sequence[str]] = None):
         choices=["flow", "har"],
         help="Override the input file format auto-detection.",
     )
+    parser.add_argument(
+        "--spec-format",
+        choices=spec_io.SPEC_FORMATS,
+        help="Override the output file format detection, which goes by its extension.",
+    )
     parser.add_argument(
         "-r",
         "--param-regex",
         default="[0-9]+",
         help="Regex to match parameters in the API paths. Path segments that match this regex will be turned into parameter placeholders.",
     )
+    parser.add_argument(
+        "--cluster-threshold",
+        type=int,
+        default=DEFAULT_CARDINALITY_THRESHOLD,
+        help="How many distinct values a path segment may take, among otherwise identical paths, before it is turned into a parameter placeholder.",
+    )
+    parser.add_argument(
+        "--no-cluster-paths",
+        action="store_true",
+        help="Keep every concrete API path, instead of turning ids, hashes, tokens and high-cardinality segments into parameter placeholders.",
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        default=swagger_util.MAX_SCHEMA_DEPTH,
+        help="How deep to follow nested objects and arrays when inferring schemas and examples. Anything nested deeper is left as an empty schema.",
+    )
+    parser.add_argument(
+        "--array-samples",
+        type=int,
+        default=swagger_util.MAX_SAMPLED_ELEMENTS,
+        help="How many elements of each array to infer its item schema from: the first, the last and evenly spaced ones in between. The schemas of the sampled elements are merged.",
+    )
     parser.add_argument(
         "-s",
         "--suppress-params",
         action="store_true",
-        help="Do not include API paths that have the original parameter values, only the ones with placeholders.",
+        help="Do not include API paths that have the original parameter values, only the ones with placeholders. Concrete paths that were added before their template was learned are removed once it is.",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes used to parse HAR entries or decode mitmproxy flows in parallel. Use 0 for one per CPU core.",
+    )
+    parser.add_argument(
+        "--low-memory",
+        action="store_true",
+        help="Read HAR files one entry at a time from a memory map instead of keeping every parsed entry alive.",
+    )
+    parser.add_argument(
+        "--report-memory",
+        action="store_true",
+        help="Print the peak memory usage of the run when it finishes.",
+    )
+    parser.add_argument(
+        "--concurrent-readers",
+        type=int,
+        default=4,
+        help="How many captures to read at the same time when --input matches several files.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Keep an index of processed flows next to the output file (<output>.index) and skip them on later runs. Append-only mitmproxy dumps are resumed where the last run stopped.",
+    )
+    parser.add_argument(
+        "--keep-duplicates",
+        action="store_true",
+        help="Process every flow, even ones identical to a flow seen earlier in the run.",
+    )
+    parser.add_argument(
+        "--include-url",
+        action="append",
+        help="Only process requests whose URL matches this glob. Can be given multiple times.",
+    )
+    parser.add_argument(
+        "--exclude-url",
+        action="append",
+        help="Skip requests whose URL matches this glob. Can be given multiple times.",
+    )
+    parser.add_argument(
+        "--mime-types",
+        help="Comma separated response MIME type globs to process, e.g. 'application/json,text/*'.",
+    )
+    parser.add_argument(
+        "--resource-types",
+        help="Comma separated HAR resource types to process, e.g. 'xhr,fetch'.",
     )
+    parser.add_argument(
+        "--sample-per-endpoint",
+        type=int,
+        default=0,
+        help="Only infer schemas from a random sample of at most this many flows per path template, method and status. 0 processes every flow.",
+    )
+    parser.add_argument(
+        "--sample-seed",
+        type=int,
+        help="Seed for --sample-per-endpoint, to make the sample reproducible.",
+    )
+    parser.add_argument(
+        "--capture-index",
+        help="Read flows through an index built by web2sdk-index instead of scanning the input files.",
+    )
+    parser.add_argument(
+        "--endpoint",
+        action="append",
+        help="With --capture-index, only read the flows of this endpoint, e.g. 'GET /users/{id}'. Can be given multiple times.",
+    )
+    add_profile_arguments(parser)
+    return parser
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--profile",
+        metavar="REPORT",
+        help="Write the wall and CPU time of each stage, flow and body counters, and the peak memory usage of the run to this JSON file.",
+    )
+    parser.add_argument(
+        "--profile-stage",
+        choices=profiling.STAGES,
+        help="With --profile, also run this stage under cProfile and write the data next to the report, as <report>.prof.",
+    )
+
+
+def parse_args(override_args: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = build_parser()
     args = parser.parse_args(override_args)
+    if args.endpoint and not args.capture_index:
+        parser.error("--endpoint only selects flows of a --capture-index")
+    return args
+
+
+def make_flow_reader(args, input_paths, flow_filter):
+    if args.capture_index:
+        capture_index = CaptureIndex(args.capture_index)
+        stale_paths = [path for path in input_paths if not capture_index.is_current(path)]
+        if stale_paths:
+            raise CaptureError(
+                f"'{stale_paths[0]}' is not in the capture index or has changed since it was indexed. Rebuild the index with web2sdk-index."
+            )
+        return IndexedCaptureReader(
+            capture_index,
+            args.endpoint or [],
+            input_paths,
+            progress_callback,
+            flow_filter=flow_filter,
+        )
+    if len(input_paths) == 1:
+        return make_capture_reader(input_paths[0], args, flow_filter)
+    return MultiCaptureReader(
+        [make_capture_reader(path, args, flow_filter) for path in input_paths],
+        progress_callback,
+        concurrency=args.concurrent_readers,
+    )
+
+
+def generate_swagger(args: argparse.Namespace, sdk_name: str) -> Dict[str, Any]:
+    """Infer an OpenAPI spec from the captures of args and return it.
+
+    args holds the options of the web2swagger command, see parse_args.
+    If args.output is set, the spec there is extended and written back,
+    otherwise the spec is only built in memory. Raises CaptureError if the
+    captures can't be read.
+    """
+    # normalized on a copy, so the same args can be used for several runs
+    args = copy.copy(args)
+    if args.workers <= 0:
+        args.workers = os.cpu_count() or 1
     try:
-        args.param_regex = re.compile("^" + args.param_regex + "$")
+        param_regex = re.compile("^" + args.param_regex + "$")
     except re.error as e:
-        print(
-            f"{console_util.ANSI_RED}Invalid path parameter regex: {e}{console_util.ANSI_RESET}"
-        )
-        sys.exit(1)
+        raise CaptureError(f"Invalid path parameter regex: {e}") from None
 
-    yaml = ruamel.yaml.YAML()
+    # strip the trailing slash from the api prefix
+    api_prefix = args.api_prefix.rstrip("/")
+
+    flow_filter = FlowFilter(
+        api_prefix=api_prefix,
+        include_urls=args.include_url,
+        exclude_urls=args.exclude_url,
+        mime_types=args.mime_types.split(",") if args.mime_types else None,
+        resource_types=args.resource_types.split(",") if args.resource_types else None,
+    )
 
-    capture_reader: Union[MitmproxyCaptureReader, HarCaptureReader]
-    if args.format == "flow" or args.format == "mitmproxy":
-        capture_reader = MitmproxyCaptureReader(args.input, progress_callback)
-    elif args.format == "har":
-        capture_reader = HarCaptureReader(args.input, progress_callback)
-    else:
-        capture_reader = detect_input_format(args.input)
+    input_paths = expand_input_paths(args.input)
+    if len(input_paths) == 0:
+        raise CaptureError(f"No capture files found at '{args.input}'.")
+
+    capture_reader = make_flow_reader(args, input_paths, flow_filter)
 
     swagger = None
 
     # try loading the existing swagger file
-    try:
-        base_dir = os.getcwd()
-        relative_path = args.output
-        abs_path = os.path.join(base_dir, relative_path)
-        with open(abs_path, "r") as f:
-            swagger = yaml.load(f)
-    except FileNotFoundError:
-        print("No existing OpenAPI file found. Creating new one.")
+    if args.output:
+        try:
+            base_dir = os.getcwd()
+            relative_path = args.output
+            abs_path = os.path.join(base_dir, relative_path)
+            swagger = spec_io.load_spec(abs_path, args.spec_format)
+        except FileNotFoundError:
+            print("No existing OpenAPI file found. Creating new one.")
+    flow_index = (
+        FlowIndex(args.output + ".index") if args.incremental and args.output else None
+    )
     if swagger is None:
-        swagger = ruamel.yaml.comments.CommentedMap(
-            {
-                "openapi": "3.0.0",
-                "info": {
-                    "title ": args.input + sdk_name,
-                    "version": "1.0.0",
-                },
-            }
-        )
-    # strip the trailing slash from the api prefix
-    args.api_prefix = args.api_prefix.rstrip("/")
-
-    if "servers" not in swagger or swagger["servers"] is None:
-        swagger["servers"] = []
+        # the flows in the index were merged into a spec that no longer exists
+        if flow_index is not None:
+            flow_index.clear()
+        swagger = new_swagger(args.input + sdk_name)
+    path_clusterer = None
+    if not args.no_cluster_paths:
+        path_clusterer = PathClusterer(param_regex, args.cluster_threshold)
+    builder = SwaggerBuilder(
+        swagger,
+        api_prefix,
+        examples=args.examples,
+        headers=args.headers,
+        path_clusterer=path_clusterer,
+        max_depth=args.max_depth,
+        max_elements=args.array_samples,
+    )
 
-    # add the server if it doesn't exist
-    if not any(server["url"] == args.api_prefix for server in swagger["servers"]):
-        swagger["servers"].append(
-            {"url": args.api_prefix, "description": "The default server"}
+    if isinstance(capture_reader, MultiCaptureReader):
+        readers = capture_reader.readers
+    else:
+        readers = [capture_reader]
+    if flow_index is not None:
+        for reader in readers:
+            if isinstance(reader, MitmproxyCaptureReader):
+                reader.start_offset = flow_index.resume_offset(reader.file_path)
+    flows = profiling.timed_iter("read", capture_reader.captured_requests(), "flows_read")
+    # sampling only looks at the method and URL, so it goes first and the bodies of flows it
+    # drops are never hashed for the duplicate filter and the index
+    sampler = None
+    if args.sample_per_endpoint > 0:
+        sampler = ReservoirSampler(
+            args.sample_per_endpoint, builder.endpoint_key, seed=args.sample_seed
         )
+        flows = sampler.sampled_flows(flows)
+    duplicate_filter = None
+    if not args.keep_duplicates:
+        duplicate_filter = DuplicateFlowFilter()
+        flows = duplicate_filter.unique_flows(flows)
+    if flow_index is not None:
+        flows = flow_index.new_flows(flows)
 
-    if "paths" not in swagger or swagger["paths"] is None:
-        swagger["paths"] = {}
+    try:
+        for req in flows:
+            with profiling.stage("add_flow"):
+                builder.add_flow(req)
+            # only flows merged into the spec are indexed as processed
+            if flow_index is not None:
+                flow_index.add(flow_fingerprint(req))
+    except (FlowReadException, ValueError) as e:
+        message = f"Failed to parse the input file as '{capture_reader.name()}'."
+        if not args.format:
+            message += " It might happen that the input format as incorrectly detected. Please try using '--format flow' or '--format har' to specify the input format."
+        raise CaptureError(message) from e
 
-    # Add the component/securitySchemes section if it doesn't exist
-    if "components" not in swagger or swagger["components"] is None:
-        swagger["components"] = {}
+    with profiling.stage("finalize"):
+        builder.finalize(keep_concrete=not args.suppress_params)
+    profiling.count(
+        "endpoints", sum(len(operations) for operations in swagger["paths"].values())
+    )
 
-    # add existing path templates
-    path_templates = []
-    for path in swagger["paths"]:
-        path_templates.append(path)
+    # save the swagger file
+    if args.output:
+        spec_io.dump_spec(swagger, args.output, args.spec_format)
+    if flow_index is not None:
+        for reader in readers:
+            if isinstance(reader, MitmproxyCaptureReader):
+                flow_index.record_capture(reader.file_path, reader.end_offset)
+        flow_index.commit()
+        flow_index.close()
+    print(" Done!")
+    if duplicate_filter is not None:
+        print(f"Dropped {duplicate_filter.dropped} duplicate flows.")
+        profiling.count("flows_duplicate", duplicate_filter.dropped)
+    if flow_index is not None:
+        print(f"Skipped {flow_index.skipped} flows that were already processed.")
+        profiling.count("flows_already_processed", flow_index.skipped)
+    if sampler is not None:
+        print(f"Sampled out {sampler.dropped} flows.")
+        profiling.count("flows_sampled_out", sampler.dropped)
+    if args.report_memory:
+        console_util.print_peak_memory_usage()
+    return swagger
 
-    path_template_regexes = [re.compile(path_to_regex(path)) for path in path_templates]
 
+def main(sdk_name: str, override_args: Optional[Sequence[str]] = None):
+    args = parse_args(override_args)
     try:
-        for req in capture_reader.captured_requests():
-            # strip the api prefix from the url
-            url = req.get_matching_url(args.api_prefix)
-
-            if url is None:
-                continue
-            method = req.get_method().lower()
-            path = strip_query_string(url).removeprefix(args.api_prefix)
-            status = req.get_response_status_code()
-
-            # check if the path matches any of the path templates, and save the index
-            path_template_index = None
-            for i, path_template_regex in enumerate(path_template_regexes):
-                if path_template_regex.match(path):
-                    path_template_index = i
-                    break
-            if path_template_index is None:
-                path_template_to_set = path
+        with profiling.profiled(args.profile, args.profile_stage):
+            generate_swagger(args, sdk_name)
+    except CaptureError as e:
+        cause = e.__cause__
+        if cause is not None:
+            if isinstance(cause, FlowReadException):
+                print(f"Flow file corrupted: {cause}")
             else:
-                path_template_to_set = path_templates[path_template_index]
-            
-            set_key_if_not_exists(swagger["paths"], path_template_to_set, {})
-
-            set_key_if_not_exists(
-                swagger["paths"][path_template_to_set],
-                method,
-                {
-                    "summary": swagger_util.path_template_to_endpoint_name(
-                        method, path_template_to_set
-                    ),
-                    "responses": {},
-                },
-            )
-
-            params = swagger_util.url_to_params(url, path_template_to_set)
-            if args.headers:
-                headers_request = swagger_util.request_to_headers(
-                    req.get_request_headers()
-                )
-                if headers_request is not None and len(headers_request) > 0:
-                    set_key_if_not_exists(
-                        swagger["paths"][path_template_to_set][method],
-                        "parameters",
-                        headers_request,
-                    )
-            if params is not None and len(params) > 0:
-                set_key_if_not_exists(
-                    swagger["paths"][path_template_to_set][method], "parameters", params
-                )
-
-            if method not in ["get", "head"]:
-                body = req.get_request_body()
-                if body is not None:
-                    body_val = None
-                    content_type = None
-                    # try to parse the body as json
-                    try:
-                        body_val = json.loads(req.get_request_body())
-                        content_type = "application/json"
-                    except UnicodeDecodeError:
-                        pass
-                    except json.decoder.JSONDecodeError:
-                        pass
-
-                    # try to parse the body as msgpack, if it's not json
-                    if body_val is None:
-                        try:
-                            body_val = msgpack.loads(req.get_request_body())
-                            content_type = "application/msgpack"
-                        except Exception:
-                            pass
-
-                    if content_type is None:
-                        # try to parse the body as form data
-                        try:
-                            body_val_bytes: Any = dict(
-                                urllib.parse.parse_qsl(
-                                    body, encoding="utf-8", keep_blank_values=True
-                                )
-                            )
-                            body_val = {}
-                            did_find_anything = False
-                            for key, value in body_val_bytes.items():
-                                did_find_anything = True
-                                body_val[key.decode("utf-8")] = value.decode("utf-8")
-                            if did_find_anything:
-                                content_type = "application/x-www-form-urlencoded"
-                            else:
-                                body_val = None
-                        except UnicodeDecodeError:
-                            pass
-
-                    if body_val is not None:
-                        content_to_set = {
-                            "content": {
-                                content_type: {
-                                    "schema": swagger_util.value_to_schema(body_val)
-                                }
-                            }
-                        }
-                        if args.examples:
-                            content_to_set["content"][content_type][
-                                "example"
-                            ] = swagger_util.limit_example_size(body_val)
-                        set_key_if_not_exists(
-                            swagger["paths"][path_template_to_set][method],
-                            "requestBody",
-                            content_to_set,
-                        )
-
-            response_body = req.get_response_body()
-            if response_body is not None:
-                # try parsing the response as json
-                try:
-                    response_parsed = json.loads(response_body)
-                    response_content_type = "application/json"
-                except UnicodeDecodeError:
-                    response_parsed = None
-                except json.decoder.JSONDecodeError:
-                    response_parsed = None
-
-                if response_parsed is None:
-                    # try parsing the response as msgpack, if it's not json
-                    try:
-                        response_parsed = msgpack.loads(response_body)
-                        response_content_type = "application/msgpack"
-                    except Exception:
-                        response_parsed = None
-                
-                if response_parsed is None:
-                    # try parsing the response as text
-                    if type(response_body) is str:
-                        response_parsed = response_body
-                    else:
-                        response_parsed = response_body.decode("utf-8", "ignore")
-                    response_content_type = req.get_response_headers().get("content-type")
-                    if type(response_content_type) is list:
-                        response_content_type = response_content_type[0]
-                    elif response_content_type is None:
-                        response_content_type = "text/plain"
-
-                if response_parsed is not None:
-                    resp_data_to_set = {
-                        "description": req.get_response_reason(),
-                        "content": {
-                            response_content_type: {
-                                "schema": swagger_util.value_to_schema(response_parsed)
-                            }
-                        },
-                    }
-                    if args.examples:
-                        resp_data_to_set["content"][response_content_type][
-                            "example"
-                        ] = swagger_util.limit_example_size(response_parsed)
-                    if args.headers:
-                        resp_data_to_set["headers"] = swagger_util.response_to_headers(
-                            req.get_response_headers()
-                        )
+                print(f"{type(cause).__name__}: {cause}")
+            traceback.print_exception(type(cause), cause, cause.__traceback__)
+        print(f"{console_util.ANSI_RED}{e}{console_util.ANSI_RESET}")
+        sys.exit(1)
 
-                    set_key_if_not_exists(
-                        swagger["paths"][path_template_to_set][method]["responses"],
-                        str(status),
-                        resp_data_to_set,
-                    )
 
-            if (
-                "responses" in swagger["paths"][path_template_to_set][method]
-                and len(swagger["paths"][path_template_to_set][method]["responses"])
-                == 0
-            ):
-                # add a default response if there were no responses detected,
-                # this is for compliance with the OpenAPI spec
-                content_type = (
-                    req.get_response_headers().get("content-type") or "text/plain"
-                )
+def index_main(override_args: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Records where each flow of a mitmproxy dump file or HAR is stored, by endpoint, so web2swagger can read the flows of one endpoint without scanning the whole capture."
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        help="The mitmproxy dump file or HAR to index. Can also be a directory or a glob pattern. Compressed captures are not supported.",
+        required=True,
+    )
+    parser.add_argument(
+        "-x", "--index", help="The index file to create or update.", required=True
+    )
+    parser.add_argument("-p", "--api-prefix", help="The api prefix", required=True)
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=["flow", "har"],
+        help="Override the input file format auto-detection.",
+    )
+    parser.add_argument(
+        "--spec",
+        help="An existing swagger schema file whose path templates are used to group the flows.",
+    )
+    parser.add_argument(
+        "--list",
+        action="store_true",
+        help="Print the indexed endpoints and how many flows each has.",
+    )
+    args = parser.parse_args(override_args)
+    args.api_prefix = args.api_prefix.rstrip("/")
+    args.workers = 1
+    args.low_memory = False
 
-                swagger["paths"][path_template_to_set][method]["responses"]["200"] = {
-                    "description": "OK",
-                    "content": {},
-                }
+    swagger = None
+    if args.spec:
+        swagger = spec_io.load_spec(args.spec)
+    builder = SwaggerBuilder(
+        swagger or new_swagger(""), args.api_prefix, path_clusterer=PathClusterer()
+    )
 
-    except FlowReadException as e:
-        print(f"Flow file corrupted: {e}")
-        traceback.print_exception(*sys.exc_info())
-        print(
-            f"{console_util.ANSI_RED}Failed to parse the input file as '{capture_reader.name()}'. "
+    capture_index = CaptureIndex(args.index)
+    flow_filter = FlowFilter(api_prefix=args.api_prefix)
+    # a segment only becomes a path parameter once enough distinct values of it were seen, so
+    # the paths of every capture are learned from before any flow is stored with its template
+    scanned = []
+    for file_path in expand_input_paths(args.input):
+        reader = make_capture_reader(file_path, args, flow_filter)
+        reader.progress_callback = lambda progress: console_util.print_progress_bar(
+            progress, f"Scanning {file_path}..."
         )
-        if not args.format:
-            print(
-                f"It might happen that the input format as incorrectly detected. Please try using '--format flow' or '--format har' to specify the input format.{console_util.ANSI_RESET}"
-            )
-        sys.exit(1)
-    except ValueError as e:
-        print(f"ValueError: {e}")
-        # print stack trace
-        traceback.print_exception(*sys.exc_info())
-        print(
-            f"{console_util.ANSI_RED}Failed to parse the input file as '{capture_reader.name()}'. "
+        try:
+            flows = scan_capture(reader, args.api_prefix)
+        except ValueError as e:
+            print(f"{console_util.ANSI_RED}{e}{console_util.ANSI_RESET}")
+            sys.exit(1)
+        for _, _, _, path, _ in flows:
+            builder.match_path_template(path)
+        scanned.append((reader, flows))
+        print()
+    for reader, flows in scanned:
+        count = capture_index.add_capture(
+            reader, flows, lambda path: builder.match_path_template(path, learn=False)
         )
-        if not args.format:
-            print(
-                f"It might happen that the input format as incorrectly detected. Please try using '--format flow' or '--format har' to specify the input format.{console_util.ANSI_RESET}"
-            )
-        sys.exit(1)
-
-    # save the swagger file
-    with open(args.output, "w") as f:
-        yaml.dump(swagger, f)
-    print(" Done!")
+        capture_index.commit()
+        print(f"Indexed {count} flows of {reader.file_path}")
+    if args.list:
+        for method, path_template, status, count in capture_index.endpoints():
+            print(f"{method.upper()} {path_template} {status}: {count}")
+    capture_index.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""A mitmproxy addon that updates an OpenAPI spec while traffic is proxied.
+
+Usage:
+
+    mitmdump -s web2sdk/web2swagger/mitmproxy_addon.py \\
+        --set web2sdk_api_prefix=https://api.example.com/v1 \\
+        --set web2sdk_output=generated/ExampleAPI.yaml \\
+        --set web2sdk_sdk_name=ExampleAPI
+
+Each completed response is merged into the spec in memory. The spec is
+written out at most once per `web2sdk_flush_interval` seconds, and when
+mitmproxy shuts down.
+"""
+import copy
+import logging
+import os
+import threading
+from typing import Optional
+
+from mitmproxy import ctx, http
+
+from web2sdk import spec_io
+from web2sdk.swagger2sdk.main import construct_sdk
+from web2sdk.web2swagger.flow_filter import FlowFilter
+from web2sdk.web2swagger.main import SwaggerBuilder, new_swagger
+from web2sdk.web2swagger.mitmproxy_capture_reader import (
+    MitmproxyFlowWrapper,
+    flow_passes_filter,
+)
+from web2sdk.web2swagger.path_clustering import PathClusterer
+
+
+class Web2SwaggerAddon:
+    def __init__(self):
+        self.builder: Optional[SwaggerBuilder] = None
+        self.flow_filter: Optional[FlowFilter] = None
+        # guards the builder and the dirty flag, flows arrive on mitmproxy's event loop
+        # while flushes run on a timer thread
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.flush_timer: Optional[threading.Timer] = None
+        # held while a flush writes the spec and regenerates the SDK
+        self.flush_lock = threading.Lock()
+
+    def load(self, loader):
+        loader.add_option(
+            "web2sdk_api_prefix", str, "", "The base URL of the API to capture."
+        )
+        loader.add_option(
+            "web2sdk_output",
+            str,
+            "generated/api.yaml",
+            "The OpenAPI spec to update, as JSON if it ends in .json. If it exists, new endpoints are added to it.",
+        )
+        loader.add_option(
+            "web2sdk_sdk_name",
+            str,
+            "",
+            "Name for the SDK class. If set, the SDK is regenerated next to the spec on every flush.",
+        )
+        loader.add_option(
+            "web2sdk_auth_type",
+            str,
+            "none",
+            "Auth type of the regenerated SDK. Possible values: basic, bearer, none.",
+        )
+        loader.add_option(
+            "web2sdk_examples", bool, False, "Include examples in the spec."
+        )
+        loader.add_option(
+            "web2sdk_headers", bool, False, "Include headers in the spec."
+        )
+        loader.add_option(
+            "web2sdk_suppress_params",
+            bool,
+            False,
+            "Do not keep the concrete paths of learned path templates, like --suppress-params.",
+        )
+        loader.add_option(
+            "web2sdk_flush_interval",
+            float,
+            0.5,
+            "Seconds to wait after a change before the spec is written.",
+        )
+
+    def configure(self, updated):
+        if not any(option.startswith("web2sdk_") for option in updated):
+            return
+        api_prefix = ctx.options.web2sdk_api_prefix.rstrip("/")
+        if api_prefix == "":
+            logging.warning("web2sdk: set web2sdk_api_prefix to start capturing")
+            return
+        # don't lose flows merged under the previous options
+        self.flush()
+        with self.lock:
+            swagger = None
+            try:
+                swagger = spec_io.load_spec(ctx.options.web2sdk_output)
+            except FileNotFoundError:
+                pass
+            if swagger is None:
+                swagger = new_swagger(ctx.options.web2sdk_sdk_name or api_prefix)
+            self.builder = SwaggerBuilder(
+                swagger,
+                api_prefix,
+                examples=ctx.options.web2sdk_examples,
+                headers=ctx.options.web2sdk_headers,
+                path_clusterer=PathClusterer(),
+            )
+            self.flow_filter = FlowFilter(api_prefix=api_prefix)
+
+    def response(self, flow: http.HTTPFlow):
+        if self.builder is None:
+            return
+        req = MitmproxyFlowWrapper(flow)
+        if not flow_passes_filter(req, self.flow_filter):
+            return
+        with self.lock:
+            self.builder.add_flow(req)
+            self.dirty = True
+            # the timer is not restarted by later flows, so sustained traffic still gets flushed
+            if self.flush_timer is None:
+                self.flush_timer = threading.Timer(
+                    ctx.options.web2sdk_flush_interval, self.flush
+                )
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+
+    def flush(self):
+        # one flush at a time, so an older snapshot never overwrites a newer one and SDK
+        # regenerations don't overlap
+        with self.flush_lock:
+            with self.lock:
+                self.flush_timer = None
+                if not self.dirty or self.builder is None:
+                    return
+                self.dirty = False
+                self.builder.finalize(keep_concrete=not ctx.options.web2sdk_suppress_params)
+                # flows keep being merged into the builder while the snapshot is written
+                swagger = copy.deepcopy(self.builder.swagger)
+            output = ctx.options.web2sdk_output
+            directory = os.path.dirname(output)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # write to a temporary file first, so readers never see a half-written spec
+            tmp_path = output + ".tmp"
+            spec_io.dump_spec(swagger, tmp_path, spec_io.spec_format(output))
+            os.replace(tmp_path, output)
+            if ctx.options.web2sdk_sdk_name:
+                self.regenerate_sdk(swagger, os.path.dirname(output) or ".")
+
+    def regenerate_sdk(self, swagger: dict, output_dir: str):
+        try:
+            construct_sdk(
+                swagger,
+                ctx.options.web2sdk_sdk_name,
+                output_dir,
+                auth_type=ctx.options.web2sdk_auth_type,
+            )
+        except Exception as e:
+            logging.warning(f"web2sdk: failed to regenerate the SDK: {e}")
+
+    def done(self):
+        timer = self.flush_timer
+        if timer is not None:
+            timer.cancel()
+        self.flush()
+
+
+addons = [Web2SwaggerAddon()]
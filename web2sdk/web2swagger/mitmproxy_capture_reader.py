@@ -1,12 +1,28 @@
 # -*- coding: utf-8 -*-
-import os
+import queue
+import re
+import threading
 import typing
-from typing import Iterator
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
 from urllib.parse import urlparse
 
+from mitmproxy import flow as mflow
 from mitmproxy import http
 from mitmproxy import io as iom
 from mitmproxy.exceptions import FlowReadException
+from mitmproxy.io import compat, tnetstring
+
+from web2sdk import profiling
+from web2sdk.web2swagger.capture_file import CaptureFile, read_capture_head
+from web2sdk.web2swagger.flow_filter import FlowFilter
+from web2sdk.web2swagger.flow_util import UNSET, headers_to_dict
+
+# target size of a batch of raw records handed to a worker process in parallel mode
+SHARD_SIZE = 4 * 1024 * 1024
+# longest length prefix accepted for a tnetstring record
+MAX_LENGTH_DIGITS = 12
 
 
 def mitmproxy_dump_file_huristic(file_path: str) -> int:
@@ -15,32 +31,64 @@ def mitmproxy_dump_file_huristic(file_path: str) -> int:
         val += 1
     if "mitmproxy" in file_path:
         val += 1
-    # read the first 2048 bytes
-    with open(file_path, "rb") as f:
-        data = f.read(2048)
-        # if file contains non-ascii characters after remove EOL characters
-        if (
-            data.decode("utf-8", "ignore")
-            .replace("\r", "")
-            .replace("\n", "")
-            .isprintable()
-            is False
-        ):
-            val += 50
-        # if first character of the byte array is a digit
-        if data[0:1].decode("utf-8", "ignore").isdigit() is True:
-            val += 5
-        # if it contains the word status_code
-        if b"status_code" in data:
-            val += 5
-        if b"regular" in data:
-            val += 10
+    # read the first 2048 (decompressed) bytes
+    data = read_capture_head(file_path, 2048)
+    # if file contains non-ascii characters after remove EOL characters
+    if (
+        data.decode("utf-8", "ignore")
+        .replace("\r", "")
+        .replace("\n", "")
+        .isprintable()
+        is False
+    ):
+        val += 50
+    # if first character of the byte array is a digit
+    if data[0:1].decode("utf-8", "ignore").isdigit() is True:
+        val += 5
+    # a flow file is a sequence of tnetstrings, e.g. "2010:9:websocket;0:~..."
+    if re.match(rb"\d+:\d+:", data):
+        val += 20
+    # if it contains the word status_code
+    if b"status_code" in data:
+        val += 5
+    if b"regular" in data:
+        val += 10
     return val
 
 
+# the URL if it starts with prefix, otherwise the first variant of it with one
+# of the replacement hostnames that does
+def match_url(url: str, prefix: str, replacement_hostnames) -> typing.Union[str, None]:
+    if url.startswith(prefix):
+        return url
+    for replacement_hostname in replacement_hostnames:
+        if replacement_hostname is not None and replacement_hostname != "":
+            fixed_url = urlparse(url)._replace(netloc=replacement_hostname).geturl()
+            if fixed_url.startswith(prefix):
+                return fixed_url
+    return None
+
+
 class MitmproxyFlowWrapper:
+    """Wraps an HTTPFlow. Headers and bodies are decoded on first use and memoized."""
+
+    __slots__ = (
+        "flow",
+        "_request_headers",
+        "_request_body",
+        "_response_headers",
+        "_response_body",
+        "fingerprint",
+    )
+
     def __init__(self, flow: http.HTTPFlow):
         self.flow = flow
+        self._request_headers = UNSET
+        self._request_body = UNSET
+        self._response_headers = UNSET
+        self._response_body = UNSET
+        # memoized by flow_index.flow_fingerprint
+        self.fingerprint = None
 
     def get_url(self) -> str:
         return self.flow.request.url
@@ -52,38 +100,31 @@ class MitmproxyFlowWrapper:
         puts the raw IP address in the URL instead of the hostname. Then
         the hostname is in the Host header.
         """
-        if self.flow.request.url.startswith(prefix):
-            return self.flow.request.url
+        return match_url(self.flow.request.url, prefix, self.replacement_hostnames())
+
+    def replacement_hostnames(self) -> typing.List[str]:
         # All the stuff where the real hostname could be
-        replacement_hostnames = [
+        return [
             self.flow.request.headers.get("Host", ""),
             self.flow.request.host_header,
             self.flow.request.host,
         ]
-        for replacement_hostname in replacement_hostnames:
-            if replacement_hostname is not None and replacement_hostname != "":
-                fixed_url = (
-                    urlparse(self.flow.request.url)
-                    ._replace(netloc=replacement_hostname)
-                    .geturl()
-                )
-                if fixed_url.startswith(prefix):
-                    return fixed_url
-        return None
 
     def get_method(self) -> str:
         return self.flow.request.method
 
     def get_request_headers(self) -> dict[str, typing.List[str]]:
-        headers: dict[str, typing.List[str]] = {}
-        for k, v in self.flow.request.headers.items(multi=True):
-            # create list on key if it does not exist
-            headers[k] = headers.get(k, [])
-            headers[k].append(v)
-        return headers
+        if self._request_headers is UNSET:
+            self._request_headers = headers_to_dict(
+                self.flow.request.headers.items(multi=True)
+            )
+        return self._request_headers
 
     def get_request_body(self):
-        return self.flow.request.content
+        # mitmproxy decodes the content-encoding on every access
+        if self._request_body is UNSET:
+            self._request_body = self.flow.request.content
+        return self._request_body
 
     def get_response_status_code(self):
         return self.flow.response.status_code
@@ -92,39 +133,333 @@ class MitmproxyFlowWrapper:
         return self.flow.response.reason
 
     def get_response_headers(self):
-        headers = {}
-        for k, v in self.flow.response.headers.items(multi=True):
-            # create list on key if it does not exist
-            headers[k] = headers.get(k, [])
-            headers[k].append(v)
-        return headers
+        if self._response_headers is UNSET:
+            self._response_headers = headers_to_dict(
+                self.flow.response.headers.items(multi=True)
+            )
+        return self._response_headers
+
+    def get_response_body(self):
+        if self._response_body is UNSET:
+            self._response_body = self.flow.response.content
+        return self._response_body
+
+
+class MitmproxyFlowSnapshot:
+    """A picklable copy of everything the inference loop reads from an HTTPFlow.
+
+    Built by worker processes in parallel mode, and exposes the same
+    interface as MitmproxyFlowWrapper.
+    """
+
+    __slots__ = (
+        "url",
+        "method",
+        "request_header_pairs",
+        "request_body",
+        "status_code",
+        "reason",
+        "response_header_pairs",
+        "response_body",
+        "hostnames",
+        "_request_headers",
+        "_response_headers",
+        "fingerprint",
+    )
+
+    def __init__(self, flow: MitmproxyFlowWrapper):
+        self.url = flow.get_url()
+        self.method = flow.get_method()
+        self.request_header_pairs = list(flow.flow.request.headers.items(multi=True))
+        self.request_body = flow.get_request_body()
+        self.status_code = flow.get_response_status_code()
+        self.reason = flow.get_response_reason()
+        self.response_header_pairs = list(flow.flow.response.headers.items(multi=True))
+        self.response_body = flow.get_response_body()
+        self.hostnames = flow.replacement_hostnames()
+        self._request_headers = UNSET
+        self._response_headers = UNSET
+        # memoized by flow_index.flow_fingerprint
+        self.fingerprint = None
+
+    def get_url(self) -> str:
+        return self.url
+
+    def get_matching_url(self, prefix) -> typing.Union[str, None]:
+        return match_url(self.url, prefix, self.hostnames)
+
+    def get_method(self) -> str:
+        return self.method
+
+    def get_request_headers(self) -> dict[str, typing.List[str]]:
+        if self._request_headers is UNSET:
+            self._request_headers = headers_to_dict(self.request_header_pairs)
+        return self._request_headers
+
+    def get_request_body(self):
+        return self.request_body
+
+    def get_response_status_code(self):
+        return self.status_code
+
+    def get_response_reason(self):
+        return self.reason
+
+    def get_response_headers(self):
+        if self._response_headers is UNSET:
+            self._response_headers = headers_to_dict(self.response_header_pairs)
+        return self._response_headers
 
     def get_response_body(self):
-        return self.flow.response.content
+        return self.response_body
+
+
+# split a flow dump into raw tnetstring records without decoding them
+def iter_raw_records(stream) -> Iterator[bytes]:
+    while True:
+        length_prefix = b""
+        while True:
+            c = stream.read(1)
+            if not c:
+                if length_prefix:
+                    raise FlowReadException("Truncated record at end of file")
+                return
+            if c == b":":
+                break
+            if not c.isdigit() or len(length_prefix) >= MAX_LENGTH_DIGITS:
+                raise FlowReadException("Invalid data format.")
+            length_prefix += c
+        # the payload is followed by a one byte type tag
+        payload = stream.read(int(length_prefix) + 1)
+        if len(payload) != int(length_prefix) + 1:
+            raise FlowReadException("Truncated record at end of file")
+        yield length_prefix + b":" + payload
+
+
+# decode one raw record, None if it is not an HTTP flow
+def decode_raw_record(record: bytes) -> Optional[http.HTTPFlow]:
+    f = mflow.Flow.from_state(compat.migrate_flow(tnetstring.loads(record)))
+    return f if isinstance(f, http.HTTPFlow) else None
+
+
+# runs in a worker process: decode raw records into snapshots, or an error message per record
+def decode_raw_records(
+    records: List[bytes], flow_filter: Optional[FlowFilter] = None
+) -> List[Tuple[Optional[MitmproxyFlowSnapshot], Optional[str]]]:
+    results = []
+    for record in records:
+        try:
+            f = decode_raw_record(record)
+            if f is None:
+                continue
+            if f.response is None:
+                results.append((None, "[warn] flow without response: {}".format(f.request.url)))
+                continue
+            flow = MitmproxyFlowWrapper(f)
+            if flow_passes_filter(flow, flow_filter):
+                results.append((MitmproxyFlowSnapshot(flow), None))
+        except Exception as e:
+            results.append((None, f"[warn] skipping corrupted flow: {str(e)[:200]}"))
+    return results
+
+
+# check a flow before its bodies are decoded; mitmproxy only decodes content on access
+def flow_passes_filter(flow: MitmproxyFlowWrapper, flow_filter: Optional[FlowFilter]) -> bool:
+    if flow_filter is None:
+        return True
+    if flow_filter.api_prefix is not None:
+        url = flow.get_matching_url(flow_filter.api_prefix)
+    else:
+        url = flow.get_url()
+    if flow_filter.accepts_url(url) and flow_filter.accepts_mime_type(
+        flow.flow.response.headers.get("content-type")
+    ):
+        return True
+    profiling.count("flows_filtered")
+    return False
 
 
 class MitmproxyCaptureReader:
-    def __init__(self, file_path, progress_callback=None):
+    def __init__(
+        self,
+        file_path,
+        progress_callback=None,
+        flow_filter: Optional[FlowFilter] = None,
+        start_offset: int = 0,
+        workers: int = 1,
+    ):
         self.file_path = file_path
         self.progress_callback = progress_callback
+        self.flow_filter = flow_filter
+        # where to start reading, to resume an append-only dump file
+        self.start_offset = start_offset
+        # end of the last complete flow that was read, None for compressed files
+        self.end_offset: Optional[int] = None
+        self.workers = workers
 
     def captured_requests(self) -> Iterator[MitmproxyFlowWrapper]:
-        with open(self.file_path, "rb") as logfile:
-            logfile_size = os.path.getsize(self.file_path)
-            freader = iom.FlowReader(logfile)
+        if self.workers > 1:
+            yield from self.captured_requests_parallel()
+            return
+        with CaptureFile(self.file_path) as capture:
+            seekable = self._seek_to_start(capture)
+            freader = iom.FlowReader(capture.stream)
             try:
                 for f in freader.stream():
+                    if seekable:
+                        self.end_offset = capture.raw.tell()
                     if self.progress_callback:
-                        self.progress_callback(logfile.tell() / logfile_size)
+                        self.progress_callback(capture.progress())
                     if isinstance(f, http.HTTPFlow):
                         if f.response is None:
                             print(
                                 "[warn] flow without response: {}".format(f.request.url)
                             )
                             continue
-                        yield MitmproxyFlowWrapper(f)
+                        flow = MitmproxyFlowWrapper(f)
+                        if flow_passes_filter(flow, self.flow_filter):
+                            yield flow
             except FlowReadException as e:
                 print(f"Flow file corrupted: {e}")
 
+    def _seek_to_start(self, capture: CaptureFile) -> bool:
+        # compressed files can only be read from the start
+        seekable = capture.compression is None
+        if seekable and self.start_offset:
+            capture.raw.seek(self.start_offset)
+        self.end_offset = capture.raw.tell() if seekable else None
+        return seekable
+
+    def captured_requests_parallel(self) -> Iterator[MitmproxyFlowSnapshot]:
+        """Split the file into raw records on a reader thread and decode them in a process pool.
+
+        Flows are yielded in file order. A record that fails to decode is
+        reported and skipped instead of ending the run, a corrupted file is
+        read up to the corruption like captured_requests does, and any other
+        error of the reader thread is raised here.
+        """
+        shards: queue.Queue = queue.Queue(maxsize=self.workers * 2)
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    shards.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def split_records(capture: CaptureFile, seekable: bool):
+            records: List[bytes] = []
+            records_size = 0
+            # end of the last record read, to resume from
+            end_offset = capture.raw.tell() if seekable else None
+            try:
+                try:
+                    for record in iter_raw_records(capture.stream):
+                        records.append(record)
+                        records_size += len(record)
+                        if seekable:
+                            end_offset += len(record)
+                        if records_size >= SHARD_SIZE:
+                            if not put((records, end_offset, capture.progress())):
+                                return
+                            records = []
+                            records_size = 0
+                finally:
+                    # the records before a corrupted one are still decoded
+                    if records:
+                        put((records, end_offset, capture.progress()))
+            except Exception as e:
+                put(e)
+            finally:
+                put(None)
+
+        with CaptureFile(self.file_path) as capture, ProcessPoolExecutor(
+            max_workers=self.workers
+        ) as pool:
+            seekable = self._seek_to_start(capture)
+            splitter = threading.Thread(
+                target=split_records, args=(capture, seekable), daemon=True
+            )
+            splitter.start()
+            pending: deque = deque()
+            try:
+                while True:
+                    item = shards.get()
+                    if item is None:
+                        break
+                    if isinstance(item, FlowReadException):
+                        print(f"Flow file corrupted: {item}")
+                        continue
+                    if isinstance(item, Exception):
+                        raise item
+                    records, end_offset, progress = item
+                    pending.append(
+                        (pool.submit(decode_raw_records, records, self.flow_filter), end_offset, progress)
+                    )
+                    if len(pending) >= self.workers * 2:
+                        yield from self._drain_shard(pending.popleft())
+                while pending:
+                    yield from self._drain_shard(pending.popleft())
+            finally:
+                stop.set()
+                splitter.join()
+
+    def _drain_shard(self, pending_shard) -> Iterator[MitmproxyFlowSnapshot]:
+        future, end_offset, progress = pending_shard
+        results = future.result()
+        if self.progress_callback:
+            self.progress_callback(progress)
+        for snapshot, warning in results:
+            if warning is not None:
+                print(warning)
+            else:
+                yield snapshot
+        self.end_offset = end_offset
+
+    def iter_indexed_flows(self) -> Iterator[Tuple[int, int, MitmproxyFlowWrapper]]:
+        """Yield the (offset, length, flow) of every flow with a response, for capture_index."""
+        with CaptureFile(self.file_path) as capture:
+            if capture.compression is not None:
+                raise ValueError(
+                    f"Compressed captures can't be indexed, decompress '{self.file_path}' first"
+                )
+            offset = 0
+            try:
+                for record in iter_raw_records(capture.stream):
+                    if self.progress_callback:
+                        self.progress_callback(capture.progress())
+                    start = offset
+                    offset += len(record)
+                    try:
+                        f = decode_raw_record(record)
+                    except Exception as e:
+                        print(f"[warn] skipping corrupted flow: {str(e)[:200]}")
+                        continue
+                    if f is None or f.response is None:
+                        continue
+                    flow = MitmproxyFlowWrapper(f)
+                    if flow_passes_filter(flow, self.flow_filter):
+                        yield start, len(record), flow
+            except FlowReadException as e:
+                print(f"Flow file corrupted: {e}")
+
+    def read_flows_at(self, spans: List[Tuple[int, int]]) -> Iterator[MitmproxyFlowWrapper]:
+        """Read the flows at the given (offset, length) spans, as recorded by capture_index.
+
+        Flows the flow filter rejects are skipped, like in a full read.
+        """
+        with open(self.file_path, "rb") as f:
+            for offset, length in spans:
+                f.seek(offset)
+                f_ = decode_raw_record(f.read(length))
+                if f_ is None:
+                    continue
+                flow = MitmproxyFlowWrapper(f_)
+                if flow_passes_filter(flow, self.flow_filter):
+                    yield flow
+
     def name(self):
         return "flow"
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import glob
+import os
+import queue
+import threading
+from typing import Iterator, List
+
+from web2sdk.web2swagger.capture_file import strip_compression_extension
+
+# how many flows may wait in the shared queue before the reader threads block
+MAX_QUEUED_FLOWS = 1024
+
+# pushed by a reader thread once it has no more captures to read
+_DONE = object()
+
+
+# the files a directory input is read for, optionally compressed
+CAPTURE_EXTENSIONS = (".har", ".flow", ".flows", ".mitm", ".dump")
+
+
+def is_capture_file(file_path: str) -> bool:
+    return strip_compression_extension(file_path.lower()).endswith(CAPTURE_EXTENSIONS)
+
+
+# turn a file, directory or glob pattern into a sorted list of capture files. Only the capture
+# files of a directory are read, so a spec or index written next to the captures is skipped
+def expand_input_paths(input_path: str) -> List[str]:
+    if os.path.isdir(input_path):
+        file_paths = sorted(
+            os.path.join(input_path, name)
+            for name in os.listdir(input_path)
+            if not name.startswith(".")
+            and os.path.isfile(os.path.join(input_path, name))
+        )
+        skipped = [path for path in file_paths if not is_capture_file(path)]
+        if skipped:
+            print(
+                f"[warn] skipping {len(skipped)} files of {input_path} that are not captures"
+                f" ({', '.join(CAPTURE_EXTENSIONS)}): {', '.join(os.path.basename(path) for path in skipped)}"
+            )
+        return [path for path in file_paths if is_capture_file(path)]
+    if any(c in input_path for c in "*?["):
+        return sorted(
+            path for path in glob.glob(input_path, recursive=True) if os.path.isfile(path)
+        )
+    return [input_path]
+
+
+class MultiCaptureReader:
+    """Reads several captures concurrently and merges their flows into one stream.
+
+    Each capture is read by its own HarCaptureReader or MitmproxyCaptureReader
+    on one of `concurrency` threads, so decompression, file I/O and any worker
+    processes of the readers overlap. Flows are yielded in arrival order.
+    """
+
+    def __init__(self, readers: list, progress_callback=None, concurrency: int = 4):
+        self.readers = readers
+        self.progress_callback = progress_callback
+        self.concurrency = max(1, min(concurrency, len(readers)))
+        self.reader_progress = [0.0] * len(readers)
+        for index, reader in enumerate(readers):
+            reader.progress_callback = self._reader_progress_callback(index)
+
+    def _reader_progress_callback(self, index: int):
+        def callback(progress):
+            self.reader_progress[index] = progress
+
+        return callback
+
+    def captured_requests(self) -> Iterator:
+        flows: queue.Queue = queue.Queue(maxsize=MAX_QUEUED_FLOWS)
+        pending: queue.Queue = queue.Queue()
+        for index in range(len(self.readers)):
+            pending.put(index)
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    flows.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def read_captures():
+            try:
+                while not stop.is_set():
+                    try:
+                        index = pending.get_nowait()
+                    except queue.Empty:
+                        break
+                    for flow in self.readers[index].captured_requests():
+                        if not put(flow):
+                            return
+                    self.reader_progress[index] = 1.0
+            except Exception as e:
+                put(e)
+            finally:
+                put(_DONE)
+
+        threads = [
+            threading.Thread(target=read_captures, daemon=True)
+            for _ in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            remaining = len(threads)
+            while remaining > 0:
+                item = flows.get()
+                if item is _DONE:
+                    remaining -= 1
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                if self.progress_callback:
+                    self.progress_callback(sum(self.reader_progress) / len(self.readers))
+                yield item
+        finally:
+            stop.set()
+
+    def name(self):
+        return "/".join(sorted(set(reader.name() for reader in self.readers)))
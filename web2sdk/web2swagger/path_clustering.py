@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from web2sdk.web2swagger.string_formats import HEX_PATTERN, UUID_PATTERN
+
+# segments that are identifiers no matter how often they were seen
+SEGMENT_DETECTORS = [
+    ("uuid", re.compile("^" + UUID_PATTERN + "$")),
+    # object ids and hashes
+    ("hex", re.compile("^" + HEX_PATTERN + "$")),
+    # base64 or url-safe tokens, a digit and a letter keep long slugs out
+    ("base64", re.compile(r"^(?=.*[0-9])(?=.*[A-Za-z])[A-Za-z0-9_\-+]{20,}={0,2}$")),
+]
+
+# the default of web2swagger's --param-regex
+DEFAULT_PARAM_REGEX = re.compile(r"^[0-9]+$")
+# how many distinct values may appear at one position before it becomes a parameter
+DEFAULT_CARDINALITY_THRESHOLD = 20
+
+# stands in for a parameter until the template is named
+_PARAM = None
+
+
+class PathClusterer:
+    """Collapses the variable segments of concrete paths into {param} templates.
+
+    A segment is a parameter if it matches param_regex or one of the
+    SEGMENT_DETECTORS, or if more than `cardinality_threshold` distinct
+    values were seen at its position, among paths that agree on the
+    segments before and after it. Parameters are named after the segment
+    before them, e.g. /users/{user_id}/posts/{post_id}.
+    """
+
+    def __init__(
+        self,
+        param_regex: Optional[re.Pattern] = DEFAULT_PARAM_REGEX,
+        cardinality_threshold: int = DEFAULT_CARDINALITY_THRESHOLD,
+    ):
+        self.param_regex = param_regex
+        self.cardinality_threshold = cardinality_threshold
+        # (segments before, segments after) -> distinct values seen in between
+        self.values: Dict[Tuple[tuple, tuple], Set[str]] = {}
+        # the positions that were seen with too many distinct values
+        self.variable: Set[Tuple[tuple, tuple]] = set()
+
+    def is_parameter(self, segment: str) -> bool:
+        if self.param_regex is not None and self.param_regex.match(segment):
+            return True
+        return any(regex.match(segment) for _, regex in SEGMENT_DETECTORS)
+
+    def cluster(self, path: str, learn: bool = True) -> str:
+        """Return the template of path. With learn, also count its segments towards the thresholds."""
+        segments: List[Optional[str]] = [
+            _PARAM if segment != "" and self.is_parameter(segment) else segment
+            for segment in path.split("/")
+        ]
+        for i, segment in enumerate(segments):
+            if segment is _PARAM or segment == "" or "{" in segment:
+                continue
+            key = (tuple(segments[:i]), tuple(segments[i + 1 :]))
+            if key in self.variable:
+                segments[i] = _PARAM
+                continue
+            if not learn:
+                continue
+            values = self.values.setdefault(key, set())
+            values.add(segment)
+            if len(values) > self.cardinality_threshold:
+                self.variable.add(key)
+                del self.values[key]
+                segments[i] = _PARAM
+        return name_parameters(segments)
+
+
+# replace each _PARAM with a placeholder named after the segment before it
+def name_parameters(segments: List[Optional[str]]) -> str:
+    used: Set[str] = set()
+    named = []
+    previous = None
+    for segment in segments:
+        if segment is not _PARAM:
+            named.append(segment)
+            if segment != "" and "{" not in segment:
+                previous = segment
+            continue
+        base = "id"
+        if previous is not None:
+            base = re.sub(r"[^0-9A-Za-z_]", "_", singular(previous).lower()) + "_id"
+        name = base
+        n = 2
+        while name in used:
+            name = f"{base}{n}"
+            n += 1
+        used.add(name)
+        named.append("{" + name + "}")
+    return "/".join(named)
+
+
+def singular(word: str) -> str:
+    if word.endswith("ies") and len(word) > 3:
+        return word[:-3] + "y"
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 1:
+        return word[:-1]
+    return word
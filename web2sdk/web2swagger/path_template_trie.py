@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import re
+from typing import Dict, List, Optional, Tuple
+
+_PARAM_RE = re.compile(r"^\{[^{}/]*\}$")
+
+
+def path_to_regex(path):
+    # replace the path template with a regex
+    path = re.escape(path)
+    path = path.replace(r"\{", "(?P<")
+    path = path.replace(r"\}", ">[^/]+)")
+    path = path.replace(r"\*", ".*")
+    return "^" + path + "$"
+
+
+# the regex for one segment of a path template, same rules as path_to_regex
+def _segment_regex(segment: str) -> re.Pattern:
+    segment = re.escape(segment)
+    segment = re.sub(r"\\\{[^/]*?\\\}", "[^/]+", segment)
+    return re.compile("^" + segment + "$")
+
+
+class _Node:
+    __slots__ = ("literals", "param", "patterns", "index", "min_index")
+
+    def __init__(self):
+        # child for a segment that is matched exactly
+        self.literals: Dict[str, "_Node"] = {}
+        # child for a segment that is a single "{name}" placeholder
+        self.param: Optional["_Node"] = None
+        # children for segments mixing text and placeholders, e.g. "{id}.json"
+        self.patterns: List[Tuple[str, re.Pattern, "_Node"]] = []
+        # insertion order of the template that ends here, None if none does
+        self.index: Optional[int] = None
+        # the smallest index of any template ending here or below
+        self.min_index: Optional[int] = None
+
+
+class PathTemplateTrie:
+    """Matches paths against path templates, one path segment at a time.
+
+    Gives the same result as trying the regex of every template in insertion
+    order and taking the first one that matches, but the work per path is
+    proportional to its depth rather than to the number of templates.
+    Templates with a "*" wildcard can span several segments, so they are
+    kept in a short list of regexes instead.
+
+    Only holds the templates it is built with, those of the seeded spec.
+    Templates the path clusterer learns change while it learns, so they
+    are matched by the clusterer, whose work is also proportional to the
+    depth of the path.
+    """
+
+    def __init__(self, templates=()):
+        self.root = _Node()
+        self.templates: List[str] = []
+        self.wildcards: List[Tuple[int, re.Pattern]] = []
+        for template in templates:
+            self._insert(template)
+
+    def _insert(self, template: str):
+        index = len(self.templates)
+        self.templates.append(template)
+        if "*" in template:
+            self.wildcards.append((index, re.compile(path_to_regex(template))))
+            return
+        node = self.root
+        # templates are inserted in index order, so the first template through a node has its
+        # smallest index
+        if node.min_index is None:
+            node.min_index = index
+        for segment in template.split("/"):
+            if "{" not in segment:
+                node = node.literals.setdefault(segment, _Node())
+            elif _PARAM_RE.match(segment):
+                if node.param is None:
+                    node.param = _Node()
+                node = node.param
+            else:
+                for pattern_segment, _, child in node.patterns:
+                    if pattern_segment == segment:
+                        node = child
+                        break
+                else:
+                    child = _Node()
+                    node.patterns.append((segment, _segment_regex(segment), child))
+                    node = child
+            if node.min_index is None:
+                node.min_index = index
+        if node.index is None:
+            node.index = index
+
+    def match(self, path: str) -> Optional[str]:
+        """Return the first inserted template that matches path, None if there is none."""
+        best = self._match(self.root, path.split("/"), 0, None)
+        for index, regex in self.wildcards:
+            if best is not None and index > best:
+                break
+            if regex.match(path):
+                best = index
+                break
+        return None if best is None else self.templates[best]
+
+    def _match(
+        self, node: _Node, segments: List[str], depth: int, best: Optional[int]
+    ) -> Optional[int]:
+        """The smallest template index below node that matches the rest of segments, if it is
+        smaller than best. Branches that can't beat best are not searched, so the search
+        doesn't grow exponentially with paths that many parameter templates match.
+        """
+        if node.min_index is None or (best is not None and node.min_index >= best):
+            return best
+        if depth == len(segments):
+            return _min_index(best, node.index)
+        segment = segments[depth]
+        child = node.literals.get(segment)
+        if child is not None:
+            best = self._match(child, segments, depth + 1, best)
+        if node.param is not None and segment != "":
+            best = self._match(node.param, segments, depth + 1, best)
+        for _, regex, child in node.patterns:
+            if regex.match(segment):
+                best = self._match(child, segments, depth + 1, best)
+        return best
+
+
+def _min_index(a: Optional[int], b: Optional[int]) -> Optional[int]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
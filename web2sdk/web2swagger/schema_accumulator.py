@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from web2sdk.web2swagger.string_formats import classify_all, string_format
+from web2sdk.web2swagger.swagger_util import (
+    MAX_SAMPLED_ELEMENTS,
+    MAX_SCHEMA_DEPTH,
+    sample_elements,
+)
+
+# order of the alternatives when a value was seen with several types
+TYPE_ORDER = ["object", "array", "string", "number", "boolean"]
+# how many distinct body shapes keep their single-sample node cached
+SHAPE_CACHE_SIZE = 1024
+# how many distinct shapes an accumulator counts before merging them in
+MAX_PENDING_SHAPES = 64
+
+# shape fingerprint -> a node holding one sample of that shape
+_shape_nodes: "OrderedDict[tuple, SchemaNode]" = OrderedDict()
+
+
+def json_type(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if type(value) is int or type(value) is float:
+        return "number"
+    if isinstance(value, dict):
+        return "object"
+    if isinstance(value, list):
+        return "array"
+    return "string"
+
+
+# fingerprints of the scalar types. Integers, integral floats and fractional floats differ, so
+# integer schemas of an existing spec are only kept while every sample is integral
+_SCALAR_SHAPES = {str: 3, int: 4, float: 11, bool: 5, type(None): 6}
+_FRACTIONAL = 12
+# fingerprints of the strings of an annotated format
+_STRING_SHAPES = {"": 3, "uuid": 8, "date-time": 9, "email": 10}
+# tokens for the end of a container, and for a value nested past the depth cap
+_END = 0
+_TRUNCATED = 7
+# marks an entry of the fingerprint stack that is an object key rather than a value
+_KEY = -1
+
+# the keywords of an existing schema that a SchemaNode rebuilds from its samples, when they
+# hold a schema. Every other keyword is carried over as it is
+_MODELED_KEYWORDS = {
+    "type",
+    "nullable",
+    "properties",
+    "additionalProperties",
+    "items",
+    "oneOf",
+    "anyOf",
+    "required",
+    "$ref",
+}
+
+
+def shape_fingerprint(
+    value, max_depth: int = MAX_SCHEMA_DEPTH, max_elements: int = MAX_SAMPLED_ELEMENTS
+) -> tuple:
+    """The keys and types of value as a tuple, looking at the same elements as SchemaNode.add.
+
+    Two values with the same fingerprint produce the same SchemaNode, so
+    the node of a shape seen before can be reused instead of walking the
+    value again. Much cheaper than SchemaNode.add, which allocates nodes
+    and tests whether object keys are ids.
+    """
+    # the structure is flattened into tokens in pre-order, each container closed by _END
+    tokens: list = [max_depth, max_elements]
+    stack: list = [(value, 0)]
+    while stack:
+        value, depth = stack.pop()
+        if depth == _KEY:
+            # keys are str tokens, so they can't be confused with the int type tokens
+            tokens.append(value)
+            continue
+        if value is _END and depth is None:
+            tokens.append(_END)
+            continue
+        if depth >= max_depth:
+            tokens.append(_TRUNCATED)
+            continue
+        t = type(value)
+        if t is dict or (t not in _SCALAR_SHAPES and isinstance(value, dict)):
+            tokens.append(1)
+            stack.append((_END, None))
+            for key in reversed(list(value)):
+                stack.append((value[key], depth + 1))
+                stack.append((key, _KEY))
+        elif t is list or (t not in _SCALAR_SHAPES and isinstance(value, list)):
+            tokens.append(2)
+            stack.append((_END, None))
+            for element in reversed(sample_elements(value, max_elements)):
+                stack.append((element, depth + 1))
+        elif t is str:
+            tokens.append(_STRING_SHAPES[string_format(value)])
+        elif t is float and not value.is_integer():
+            tokens.append(_FRACTIONAL)
+        else:
+            tokens.append(_SCALAR_SHAPES.get(t, 3))
+    # the tuple itself rather than its hash, so shapes whose hashes collide don't share a node
+    return tuple(tokens)
+
+
+# the node of a single sample of value, shared between values of the same shape
+def shape_node(
+    value,
+    fingerprint: tuple,
+    max_depth: int = MAX_SCHEMA_DEPTH,
+    max_elements: int = MAX_SAMPLED_ELEMENTS,
+) -> "SchemaNode":
+    node = _shape_nodes.get(fingerprint)
+    if node is not None:
+        _shape_nodes.move_to_end(fingerprint)
+        return node
+    node = SchemaNode()
+    node.add(value, max_depth, max_elements)
+    _shape_nodes[fingerprint] = node
+    if len(_shape_nodes) > SHAPE_CACHE_SIZE:
+        _shape_nodes.popitem(last=False)
+    return node
+
+
+# objects keyed by ids are described with additionalProperties, like value_to_schema does
+def has_generic_keys(value: dict) -> bool:
+    return classify_all(value) in ("integer", "uuid")
+
+
+# the format shared by the strings of a and b. None if either saw no strings, "" if there is none
+def common_format(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    if a is None:
+        return b
+    if b is None or a == b:
+        return a
+    return ""
+
+
+class SchemaNode:
+    """The merged structure of every sample seen at one place in a body.
+
+    Memory is proportional to the size of the merged schema: each sample
+    only bumps counters and adds the properties that were not seen before.
+    A property is required once it was present in every one of at least two
+    object samples. A value seen with several types becomes a oneOf, and
+    null makes the schema nullable. Values nested deeper than max_depth are
+    counted but not looked into, and render as {}.
+
+    The items of an array, and the values of an object keyed by ids, are
+    inferred from at most max_elements of them: the first, the last and
+    evenly strided ones in between. Their schemas are merged like separate
+    samples, so mixed arrays become a union while long arrays stay cheap.
+
+    A node seeded from an existing schema keeps what samples can't tell:
+    keywords like description, enum or minimum, a $ref, which is left
+    alone and not looked into, its required properties unless a sample
+    lacks them, and the integer type unless a sample is fractional.
+
+    Every walk over a body or a node tree uses an explicit stack, so deeply
+    nested payloads can't exhaust the interpreter's recursion limit.
+    """
+
+    __slots__ = (
+        "count",
+        "types",
+        "properties",
+        "map_count",
+        "map_values",
+        "items",
+        "format",
+        "fractional",
+        "integer",
+        "ref",
+        "required",
+        "extra",
+        "pending",
+    )
+
+    def __init__(self):
+        # samples seen here, i.e. how often the enclosing property was present
+        self.count = 0
+        # samples of each JSON type
+        self.types: Dict[str, int] = {}
+        self.properties: Dict[str, "SchemaNode"] = {}
+        # object samples keyed by ids, and the merged structure of their values
+        self.map_count = 0
+        self.map_values: Optional["SchemaNode"] = None
+        self.items: Optional["SchemaNode"] = None
+        # the OpenAPI format of every string sample, "" if they don't share one
+        self.format: Optional[str] = None
+        # whether a number sample was not integral
+        self.fractional = False
+        # what was seeded from an existing schema: whether it was an integer, its $ref, its
+        # required properties and the keywords that aren't rebuilt from samples
+        self.integer = False
+        self.ref: Optional[str] = None
+        self.required: Optional[List[str]] = None
+        self.extra: Optional[dict] = None
+        # fingerprint -> [samples, node] of shapes added by add_sample but not merged yet
+        self.pending: Optional[Dict[tuple, List]] = None
+
+    def add_sample(
+        self,
+        value,
+        max_depth: int = MAX_SCHEMA_DEPTH,
+        max_elements: int = MAX_SAMPLED_ELEMENTS,
+    ):
+        """Like add, but repeated shapes are counted and merged in once, by flush_pending."""
+        fingerprint = shape_fingerprint(value, max_depth, max_elements)
+        if self.pending is None:
+            self.pending = {}
+        entry = self.pending.get(fingerprint)
+        if entry is not None:
+            entry[0] += 1
+            return
+        if len(self.pending) >= MAX_PENDING_SHAPES:
+            self.flush_pending()
+            self.pending = {}
+        self.pending[fingerprint] = [
+            1,
+            shape_node(value, fingerprint, max_depth, max_elements),
+        ]
+
+    def flush_pending(self):
+        if self.pending is None:
+            return
+        pending = self.pending
+        self.pending = None
+        for samples, node in pending.values():
+            self.merge(node, samples)
+
+    def add(
+        self,
+        value,
+        max_depth: int = MAX_SCHEMA_DEPTH,
+        max_elements: int = MAX_SAMPLED_ELEMENTS,
+    ):
+        stack = [(self, value, 0)]
+        while stack:
+            node, value, depth = stack.pop()
+            node.count += 1
+            if depth >= max_depth or node.ref is not None:
+                continue
+            t = json_type(value)
+            node.types[t] = node.types.get(t, 0) + 1
+            if t == "number":
+                if type(value) is float and not value.is_integer():
+                    node.fractional = True
+            elif t == "string":
+                node.format = common_format(
+                    node.format, string_format(value) if type(value) is str else ""
+                )
+            elif t == "object":
+                if has_generic_keys(value):
+                    node.map_count += 1
+                    if node.map_values is None:
+                        node.map_values = SchemaNode()
+                    # pushed in reverse, so the sampled values are added in order
+                    for item in reversed(sample_elements(list(value.values()), max_elements)):
+                        stack.append((node.map_values, item, depth + 1))
+                else:
+                    for key in value:
+                        child = node.properties.get(key)
+                        if child is None:
+                            child = node.properties[key] = SchemaNode()
+                        stack.append((child, value[key], depth + 1))
+            elif t == "array" and len(value) > 0:
+                if node.items is None:
+                    node.items = SchemaNode()
+                for element in reversed(sample_elements(value, max_elements)):
+                    stack.append((node.items, element, depth + 1))
+
+    def merge(self, other: "SchemaNode", times: int = 1):
+        """Merge the samples of other into this node, times times over."""
+        self.flush_pending()
+        other.flush_pending()
+        stack = [(self, other)]
+        while stack:
+            node, other = stack.pop()
+            node.count += other.count * times
+            for t, count in other.types.items():
+                node.types[t] = node.types.get(t, 0) + count * times
+            node.format = common_format(node.format, other.format)
+            node.fractional = node.fractional or other.fractional
+            node.integer = node.integer or other.integer
+            node.ref = node.ref or other.ref
+            if node.required is None:
+                node.required = other.required
+            elif other.required is not None:
+                node.required = [key for key in node.required if key in other.required]
+            if other.extra:
+                if node.extra is None:
+                    node.extra = {}
+                for key, value in other.extra.items():
+                    node.extra.setdefault(key, value)
+            for key, other_child in other.properties.items():
+                child = node.properties.get(key)
+                if child is None:
+                    child = node.properties[key] = SchemaNode()
+                stack.append((child, other_child))
+            node.map_count += other.map_count * times
+            if other.map_values is not None:
+                if node.map_values is None:
+                    node.map_values = SchemaNode()
+                stack.append((node.map_values, other.map_values))
+            if other.items is not None:
+                if node.items is None:
+                    node.items = SchemaNode()
+                stack.append((node.items, other.items))
+
+    @classmethod
+    def from_schema(cls, schema) -> "SchemaNode":
+        """Seed a node with a schema from an existing spec. Its samples count as zero."""
+        root = cls()
+        stack = [(root, schema)]
+        while stack:
+            node, schema = stack.pop()
+            node._add_schema(schema, stack)
+        return root
+
+    # seed this node with schema, the nodes of its children are pushed onto stack
+    def _add_schema(self, schema, stack: list):
+        if not isinstance(schema, dict):
+            return
+        t = schema.get("type")
+        extra = {
+            key: value
+            for key, value in schema.items()
+            if key not in _MODELED_KEYWORDS
+            and not (key == "format" and t == "string")
+            and not (key in ("additionalProperties", "items") and isinstance(value, dict))
+        }
+        if extra:
+            if self.extra is None:
+                self.extra = {}
+            for key, value in extra.items():
+                self.extra.setdefault(key, value)
+        if "$ref" in schema:
+            # defined elsewhere in the spec, samples can't tell what else it allows
+            self.ref = schema["$ref"]
+            return
+        for alternative in (schema.get("oneOf") or []) + (schema.get("anyOf") or []):
+            stack.append((self, alternative))
+        if isinstance(schema.get("required"), list):
+            self.required = list(schema["required"])
+        has_structure = "properties" in schema or "additionalProperties" in schema
+        if schema.get("nullable"):
+            self.types.setdefault("null", 0)
+            # value_to_schema describes null as a nullable object without properties
+            if t == "object" and not has_structure:
+                return
+        if t == "integer":
+            self.integer = True
+            t = "number"
+        if t in TYPE_ORDER:
+            self.types.setdefault(t, 0)
+        if t == "string":
+            self.format = common_format(self.format, schema.get("format", ""))
+        for key, prop in (schema.get("properties") or {}).items():
+            if key not in self.properties:
+                self.properties[key] = SchemaNode()
+            stack.append((self.properties[key], prop))
+        if isinstance(schema.get("additionalProperties"), dict):
+            if self.map_values is None:
+                self.map_values = SchemaNode()
+            stack.append((self.map_values, schema["additionalProperties"]))
+        if isinstance(schema.get("items"), dict) and schema["items"]:
+            if self.items is None:
+                self.items = SchemaNode()
+            stack.append((self.items, schema["items"]))
+
+    def to_schema(self) -> dict:
+        self.flush_pending()
+        root: dict = {}
+        # every node fills in the dict its parent already placed in the parent's schema
+        stack = [(self, root)]
+        while stack:
+            node, schema = stack.pop()
+            if node.ref is not None:
+                schema["$ref"] = node.ref
+                if node.extra:
+                    schema.update(node.extra)
+                continue
+            alternatives = [node._type_schema(t, stack) for t in TYPE_ORDER if t in node.types]
+            if len(alternatives) == 0:
+                # samples without a type were nested past the depth cap, and stay {}
+                if node.count == 0 or "null" in node.types:
+                    schema.update({"type": "object", "nullable": True})
+            elif len(alternatives) == 1:
+                schema.update(alternatives[0])
+            else:
+                schema["oneOf"] = alternatives
+            if len(alternatives) > 0 and "null" in node.types:
+                schema["nullable"] = True
+            if node.extra:
+                for key, value in node.extra.items():
+                    schema.setdefault(key, value)
+        return root
+
+    # the schema of the samples of type t, the schemas of its children are filled in from stack
+    def _type_schema(self, t: str, stack: list) -> dict:
+        if t == "array":
+            items: dict = {}
+            if self.items is not None:
+                stack.append((self.items, items))
+            return {"type": "array", "items": items}
+        if t == "string" and self.format:
+            return {"type": t, "format": self.format}
+        if t == "number" and self.integer and not self.fractional:
+            return {"type": "integer"}
+        if t != "object":
+            return {"type": t}
+        if self.map_values is not None and len(self.properties) == 0:
+            additional_properties: dict = {}
+            stack.append((self.map_values, additional_properties))
+            return {"type": "object", "additionalProperties": additional_properties}
+        properties: Dict[str, dict] = {}
+        for key, node in self.properties.items():
+            properties[key] = {}
+            stack.append((node, properties[key]))
+        schema = {"type": "object", "properties": properties}
+        object_samples = self.types.get("object", 0) - self.map_count
+        if self.required is not None:
+            # the spec's required properties, unless a sample went without them
+            required = [
+                key
+                for key in self.required
+                if key not in self.properties
+                or object_samples == 0
+                or self.properties[key].count == object_samples
+            ]
+        elif object_samples >= 2:
+            required = [
+                key for key, node in self.properties.items() if node.count == object_samples
+            ]
+        else:
+            required = []
+        if len(required) > 0:
+            schema["required"] = required
+        if self.map_values is not None:
+            additional_properties = {}
+            stack.append((self.map_values, additional_properties))
+            schema["additionalProperties"] = additional_properties
+        return schema
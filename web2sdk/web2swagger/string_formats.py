@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import re
+from typing import Iterable, Optional
+
+UUID_PATTERN = r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+# object ids and hashes, at least one digit keeps long words out
+HEX_PATTERN = r"(?=[a-fA-F]*[0-9])[0-9a-fA-F]{16,}"
+
+# the formats a string is classified as, in the order they are tried
+_FORMAT_PATTERNS = [
+    ("uuid", UUID_PATTERN),
+    ("integer", r"-?[0-9]+"),
+    ("number", r"-?(?:[0-9]+\.[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?|-?[0-9]+[eE][-+]?[0-9]+"),
+    # RFC 3339, which OpenAPI's date-time is: the time zone is required
+    (
+        "date-time",
+        r"[0-9]{4}-[0-9]{2}-[0-9]{2}[Tt][0-9]{2}:[0-9]{2}:[0-9]{2}(?:\.[0-9]+)?"
+        r"(?:[Zz]|[-+][0-9]{2}:[0-9]{2})",
+    ),
+    ("email", r"[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}"),
+    ("hex", HEX_PATTERN),
+]
+
+# a single regex for every format, the name of the group that matched is the format
+_CLASSIFIER = re.compile(
+    "|".join(
+        "(?P<{}>{})".format(name.replace("-", "_"), pattern)
+        for name, pattern in _FORMAT_PATTERNS
+    )
+)
+_GROUP_FORMATS = {name.replace("-", "_"): name for name, _ in _FORMAT_PATTERNS}
+
+# longer strings are free text, not worth running the regex on
+MAX_CLASSIFIED_LENGTH = 256
+
+# formats that are annotated on string schemas, as their OpenAPI format
+STRING_FORMATS = {"uuid": "uuid", "date-time": "date-time", "email": "email"}
+
+
+def classify(value) -> Optional[str]:
+    """The format of a string: uuid, integer, number, date-time, email, hex, or None."""
+    if type(value) is not str or len(value) > MAX_CLASSIFIED_LENGTH:
+        return None
+    match = _CLASSIFIER.fullmatch(value)
+    if match is None:
+        return None
+    return _GROUP_FORMATS[match.lastgroup]
+
+
+def classify_all(values: Iterable) -> Optional[str]:
+    """The format shared by all values, None if they don't share one or there are none.
+
+    Stops at the first value that doesn't fit. Integers and numbers mixed
+    together are numbers.
+    """
+    common = None
+    for value in values:
+        kind = classify(value)
+        if kind is None:
+            return None
+        if common is None or common == kind:
+            common = kind
+        elif {common, kind} == {"integer", "number"}:
+            common = "number"
+        else:
+            return None
+    return common
+
+
+def string_format(value: str) -> str:
+    """The OpenAPI format of a string value, "" if it has none.
+
+    Cheaper than classify for the common case, strings that can't be a
+    uuid, a date-time or an email skip the regex.
+    """
+    if not (
+        len(value) == 36 or (len(value) >= 19 and value[:1].isdigit()) or "@" in value
+    ):
+        return ""
+    return STRING_FORMATS.get(classify(value), "")
+
+
+# the schema of a parameter or header, from one of its values
+def scalar_schema(value) -> dict:
+    kind = classify(value)
+    if kind == "integer" or kind == "number":
+        return {"type": "number"}
+    if kind in STRING_FORMATS:
+        return {"type": "string", "format": STRING_FORMATS[kind]}
+    return {"type": "string"}
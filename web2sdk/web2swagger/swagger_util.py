@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
+import itertools
 import urllib
-import uuid
 from typing import Any, List
 
+from web2sdk.web2swagger import string_formats
+
 VERBS = [
     "add",
     "create",
@@ -59,9 +61,7 @@ def url_to_params(url, path_template):
                     "name": segment.replace("{", "").replace("}", ""),
                     "in": "path",
                     "required": True,
-                    "schema": {
-                        "type": "number" if url_segments[idx].isdigit() else "string"
-                    },
+                    "schema": string_formats.scalar_schema(url_segments[idx]),
                 }
             )
     query_string = urllib.parse.urlparse(url).query
@@ -73,9 +73,7 @@ def url_to_params(url, path_template):
                     "name": key,
                     "in": "query",
                     "required": False,
-                    "schema": {
-                        "type": "number" if query_params[key][0].isdigit() else "string"
-                    },
+                    "schema": string_formats.scalar_schema(query_params[key][0]),
                 }
             )
     return params
@@ -91,7 +89,7 @@ def request_to_headers(headers: dict[str, List[Any]], add_example: bool = False)
                 "name": key,
                 "in": "header",
                 "required": False,
-                "schema": {"type": "number" if headers[key][0].isdigit() else "string"},
+                "schema": string_formats.scalar_schema(headers[key][0]),
             }
             if add_example:
                 h["example"] = headers[key][0]
@@ -105,82 +103,75 @@ def response_to_headers(headers):
         for key in headers:
             header[key] = {
                 "description": headers[key][0],
-                "schema": {"type": "number" if headers[key][0].isdigit() else "string"},
+                "schema": string_formats.scalar_schema(headers[key][0]),
             }
     return header
 
 
-def value_to_schema(value):
-    # check if value is a number
-    if type(value) is int or type(value) is float:
-        return {"type": "number"}
-    # check if value is a boolean
-    elif isinstance(value, bool):
-        return {"type": "boolean"}
-    # check if value is a string
-    elif isinstance(value, str):
-        return {"type": "string"}
-    # check if value is a list
-    elif isinstance(value, list):
-        if len(value) == 0:
-            return {"type": "array", "items": {}}
-
-        return {"type": "array", "items": value_to_schema(value[0])}
-    # check if value is a dict
-    elif isinstance(value, dict):
-        all_keys_are_numeric = all(is_numeric_string(key) for key in value)
-        all_keys_are_uuid = all(is_uuid(key) for key in value)
-        keys_are_generic = all_keys_are_numeric or all_keys_are_uuid
-
-        if keys_are_generic and len(value) > 0:
-            return {
-                "type": "object",
-                "additionalProperties": value_to_schema(list(value.values())[0]),
-            }
-        return {
-            "type": "object",
-            "properties": {key: value_to_schema(value[key]) for key in value},
-        }
-    # if it is none, return null
-    elif value is None:
-        return {"type": "object", "nullable": True}
-
-
-def is_uuid(key):
-    return isinstance(key, str) and is_valid_uuid(key)
-
+# the schema of a single value, inferred the same way as the schemas of merged bodies
+def value_to_schema(value, max_depth=None, max_elements=None):
+    # imported here, schema_accumulator builds on the helpers in this module
+    from web2sdk.web2swagger.schema_accumulator import SchemaNode
 
-def is_numeric_string(key):
-    return isinstance(key, str) and key.isnumeric()
-
-
-def is_valid_uuid(val):
-    try:
-        uuid.UUID(str(val))
-        return True
-    except ValueError:
-        return False
+    node = SchemaNode()
+    node.add(
+        value,
+        MAX_SCHEMA_DEPTH if max_depth is None else max_depth,
+        MAX_SAMPLED_ELEMENTS if max_elements is None else max_elements,
+    )
+    return node.to_schema()
 
 
 MAX_EXAMPLE_ARRAY_ELEMENTS = 10
 MAX_EXAMPLE_OBJECT_PROPERTIES = 150
-
-
-# recursively scan an example value and limit the number of elements and properties
-def limit_example_size(example):
-    if isinstance(example, list):
-        new_list = []
-        for element in example:
-            if len(new_list) >= MAX_EXAMPLE_ARRAY_ELEMENTS:
-                break
-            new_list.append(limit_example_size(element))
-        return new_list
-    elif isinstance(example, dict):
-        new_dict = {}
-        for key in example:
-            if len(new_dict) >= MAX_EXAMPLE_OBJECT_PROPERTIES:
-                break
-            new_dict[key] = limit_example_size(example[key])
-        return new_dict
-    else:
-        return example
+# how deep schemas and examples follow nested objects and arrays, anything deeper becomes {}
+MAX_SCHEMA_DEPTH = 64
+# how many elements of an array, or values of an id-keyed object, a schema is inferred from
+MAX_SAMPLED_ELEMENTS = 8
+
+
+# the elements a schema is inferred from: all of them if they fit in the budget, otherwise
+# the first, the last and evenly strided ones in between
+def sample_elements(values, max_elements=None):
+    if max_elements is None:
+        max_elements = MAX_SAMPLED_ELEMENTS
+    n = len(values)
+    if n <= max_elements:
+        return values
+    if max_elements <= 1:
+        return values[:1]
+    step = (n - 1) / (max_elements - 1)
+    return [values[round(i * step)] for i in range(max_elements)]
+
+
+# scan an example value and limit the number of elements and properties, and its depth
+def limit_example_size(example, max_depth=None):
+    if max_depth is None:
+        max_depth = MAX_SCHEMA_DEPTH
+    # the copy of each container is created first and filled in when its entry is popped
+    holder = [None]
+    stack = [(example, holder, 0, 0)]
+    while stack:
+        value, parent, key, depth = stack.pop()
+        if isinstance(value, list):
+            if depth >= max_depth:
+                parent[key] = {}
+                continue
+            elements = value[:MAX_EXAMPLE_ARRAY_ELEMENTS]
+            new_list = [None] * len(elements)
+            parent[key] = new_list
+            for i, element in enumerate(elements):
+                stack.append((element, new_list, i, depth + 1))
+        elif isinstance(value, dict):
+            if depth >= max_depth:
+                parent[key] = {}
+                continue
+            new_dict = {}
+            parent[key] = new_dict
+            for name in itertools.islice(value, MAX_EXAMPLE_OBJECT_PROPERTIES):
+                # keep the key order of the original, the values are set when popped
+                new_dict[name] = None
+                stack.append((value[name], new_dict, name, depth + 1))
+        else:
+            parent[key] = value
+    return holder[0]